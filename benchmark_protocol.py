@@ -0,0 +1,473 @@
+#!/usr/bin/python
+"""
+hackathon_protocol benchmarks: framing and parsing cost per message, end-to-end throughput over
+socketpair, TCP loopback and in-memory transport, allocations per message (python 3, tracemalloc).
+
+    python benchmark_protocol.py --json before.json
+    (change protocol)
+    python benchmark_protocol.py --json after.json --compare before.json
+"""
+from __future__ import print_function # for python 2 compatibility
+import socket, threading, time, random, gc, json, sys, os, platform
+from collections import OrderedDict
+import hackathon_protocol
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None  # python 2: allocations are not measured
+
+precise_time = getattr(time, 'perf_counter', time.time)
+
+# Command line setup parameters
+MESSAGES_COUNT = 200000
+REPEAT = 3
+BURST_SIZE = 100    # orderbooks queued before each flush (like server between PREDICT_NOW messages)
+BURST_PATTERN = 'fixed'     # 'fixed': BURST_SIZE every time, 'random': 1 .. 2*BURST_SIZE-1, BURST_SIZE on average
+DEPTH = 10  # orderbook levels, defines message size
+ALLOCATION_MESSAGES = 10000 # messages processed with tracemalloc enabled (it's slow)
+
+BURST_PATTERNS = ('fixed', 'random')
+
+
+def make_orderbook_line(n, depth=DEPTH):
+    # instrument + time + (price+volume)*(bid+ask)*depth, looks like a line of training.csv
+    mid = 65000 + random.randint(-100, 100)
+    line = ['TEA', '2017-11-%02d 10:00:00.%06d' % (1 + n % 28, n % 1000000)]
+    for level in range(1, depth + 1):
+        line += [float(mid + level), float(random.randint(1, 1000)), float(mid - level), float(random.randint(1, 1000))]
+    return line
+
+
+def make_header(depth=DEPTH):
+    header = ['INSTRUMENT', 'TIME']
+    for level in range(1, depth + 1):
+        header += ['ASK_P_%d' % level, 'ASK_V_%d' % level, 'BID_P_%d' % level, 'BID_V_%d' % level]
+    return header
+
+
+def make_lines(messages_count, depth=DEPTH):
+    # 100 different orderbooks repeated
+    lines = [make_orderbook_line(n, depth) for n in range(100)]
+    return [lines[n % len(lines)] for n in range(messages_count)]
+
+
+def make_frames(messages_count, checksum_mode=hackathon_protocol.CHECKSUM_MD5, depth=DEPTH):
+    # framed ORDERBOOK messages (as server sends them)
+    lines = [make_orderbook_line(n, depth) for n in range(100)]
+    return [hackathon_protocol.prepare_orderbook_raw_message(lines[n % len(lines)], checksum_mode) for n in range(messages_count)]
+
+
+def make_stream(messages_count, checksum_mode=hackathon_protocol.CHECKSUM_MD5, depth=DEPTH):
+    # one contiguous byte stream with framed ORDERBOOK messages
+    return b''.join(make_frames(messages_count, checksum_mode, depth))
+
+
+def make_bursts(messages_count, burst_size, pattern=BURST_PATTERN):
+    # sizes of bursts (messages sent before each flush), sum is messages_count
+    generator = random.Random(1)
+    bursts, left = [], messages_count
+    while left > 0:
+        size = burst_size if pattern == 'fixed' else generator.randint(1, 2 * burst_size - 1)
+        bursts.append(min(size, left))
+        left -= bursts[-1]
+    return bursts
+
+
+class CountingSession(hackathon_protocol.SessionImpl):
+    def __init__(self, sock):
+        super(CountingSession, self).__init__(sock)
+        self.messages_count = 0
+
+    def on_message(self, message_body):
+        self.messages_count += 1
+
+
+class LegacyRecvSession(CountingSession):
+    # receive loop of SessionImpl.run before recv_into/memoryview framing: kept to compare with
+    def run(self):
+        prefix_len = hackathon_protocol.PREFIX_LEN
+        recv_buffer = bytearray()
+        try:
+            while True:
+                try:
+                    just_recv = self.sock.recv(1024*1024)
+                except socket.timeout:
+                    continue
+
+                if not just_recv: break
+
+                recv_buffer += just_recv
+                while True:
+                    if len(recv_buffer) < prefix_len:
+                        break
+                    body_len = int(recv_buffer[:hackathon_protocol.MBODYLEN_LEN])
+                    msg_len = prefix_len + body_len
+                    if len(recv_buffer) < msg_len:
+                        break
+                    raw_message = recv_buffer[:msg_len]
+                    self.log(False, raw_message)
+                    checksum = raw_message[hackathon_protocol.MBODYLEN_LEN + 1 : prefix_len - 1]
+                    body = raw_message[prefix_len:]
+                    if hackathon_protocol.bytes_to_string(checksum) != hackathon_protocol.get_hex_checksum(body):
+                        raise ValueError("Checksum error")
+                    self.on_message(hackathon_protocol.bytes_to_string(body))
+                    del recv_buffer[:msg_len]
+        finally:
+            self.sock.close()
+
+
+class LegacySendSession(CountingSession):
+    # send loop of SessionImpl.run before sendmsg(): 2 KiB chunks from a bytearray, kept to compare with
+    def __init__(self, sock):
+        super(LegacySendSession, self).__init__(sock)
+        self.send_buffer = bytearray()
+
+    def send_raw_message(self, message_bytes):
+        self.log(True, message_bytes)
+        self.send_buffer += message_bytes
+        self.messages_sent += 1
+        return self
+
+    def flush_send_queue(self):
+        while len(self.send_buffer) > 0:
+            CHUNK_SIZE = 2*1024
+            self.sock.send(self.send_buffer[:CHUNK_SIZE])
+            self.send_syscalls += 1
+            del self.send_buffer[:CHUNK_SIZE]
+
+
+def measure_send(session_class, frames, bursts):
+    # returns (messages per second, syscalls per message) for sending frames through socketpair
+    reader, writer = socket.socketpair()
+    expected_bytes = sum(len(f) for f in frames)
+    received = [0]
+
+    def read_all():
+        while True:
+            just_recv = reader.recv(1024*1024)
+            if not just_recv: break
+            received[0] += len(just_recv)
+        reader.close()
+
+    session = session_class(writer)
+    thread = threading.Thread(target=read_all)
+    thread.start()
+    start = precise_time()
+    n = 0
+    for burst in bursts:
+        for frame in frames[n : n + burst]:
+            session.send_raw_message(frame)
+        session.flush_send_queue()
+        n += burst
+    elapsed = precise_time() - start
+    writer.close()
+    thread.join()
+    assert received[0] == expected_bytes
+    return len(frames) / elapsed, session.send_syscalls / float(len(frames))
+
+
+def bench_send(results, messages_count, repeat, bursts):
+    frames = make_frames(messages_count)
+    print("Send: %d messages, %.1f per flush" % (messages_count, messages_count / float(len(bursts))))
+    for name, session_class in (("legacy send()", LegacySendSession), ("sendmsg()", CountingSession)):
+        best, syscalls = max(measure_send(session_class, frames, bursts) for _ in range(repeat))
+        print("  %-16s %12.0f msgs/sec %8.4f syscalls/msg" % (name, best, syscalls))
+        results['send ' + name] = OrderedDict([('msgs_per_sec', best), ('syscalls_per_msg', syscalls)])
+
+
+def measure_recv(session_class, stream, messages_count):
+    # returns messages per second for receiving whole stream through socketpair
+    reader, writer = socket.socketpair()
+
+    def write_all():
+        writer.sendall(stream)
+        writer.close()
+
+    session = session_class(reader)
+    thread = threading.Thread(target=write_all)
+    start = precise_time()
+    thread.start()
+    session.run()
+    elapsed = precise_time() - start
+    thread.join()
+    assert session.messages_count == messages_count
+    return messages_count / elapsed
+
+
+def bench_recv(results, messages_count, repeat):
+    stream = make_stream(messages_count)
+    print("Receive: %d messages, %d bytes" % (messages_count, len(stream)))
+    for name, session_class in (("legacy recv()", LegacyRecvSession), ("recv_into()", CountingSession)):
+        with Quiet():
+            best = max(measure_recv(session_class, stream, messages_count) for _ in range(repeat))
+        print("  %-16s %12.0f msgs/sec" % (name, best))
+        results['recv ' + name] = OrderedDict([('msgs_per_sec', best)])
+
+
+def measure_ns_per_message(func, messages_count, repeat):
+    # best time of func(messages_count) over repeat runs, in nanoseconds per message
+    best = None
+    for _ in range(repeat):
+        start = precise_time()
+        func(messages_count)
+        elapsed = precise_time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return 1e9 * best / messages_count
+
+
+def measure_allocations(func, messages_count):
+    # for func(messages_count): (blocks, bytes) per message allocated and still kept (e.g. in its result),
+    # and peak of traced memory during the call (temporary objects)
+    if tracemalloc is None:
+        return None
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        result = func(messages_count)
+        after = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del result
+    differences = after.compare_to(before, 'filename')
+    blocks, size = sum(stat.count_diff for stat in differences), sum(stat.size_diff for stat in differences)
+    return float(blocks) / messages_count, float(size) / messages_count, peak
+
+
+class Quiet(object):
+    # suppresses prints of sessions ("TCP Session finished")
+    def __enter__(self):
+        self.stdout, sys.stdout = sys.stdout, open(os.devnull, 'w')
+
+    def __exit__(self, *exc_info):
+        sys.stdout.close()
+        sys.stdout = self.stdout
+
+
+def report_per_message(results, name, func, messages_count, repeat):
+    # func(count) processes first count messages, allocations are traced for ALLOCATION_MESSAGES (tracing is slow)
+    with Quiet():
+        ns = measure_ns_per_message(func, messages_count, repeat)
+        allocations = measure_allocations(func, min(messages_count, ALLOCATION_MESSAGES))
+
+    result = results[name] = OrderedDict([('ns_per_msg', ns)])
+    if allocations is None:
+        print("  %-36s %10.0f ns/msg" % (name, ns))
+        return
+    result['blocks_per_msg'], result['bytes_per_msg'], result['peak_bytes'] = allocations
+    print("  %-36s %10.0f ns/msg %8.2f blocks/msg %8.0f bytes/msg %10.1f KiB peak"
+          % (name, ns, allocations[0], allocations[1], allocations[2] / 1024.0))
+
+
+def bench_framing(results, messages_count, repeat, depth):
+    # messages as the server prepares them (kept in a list: allocations are memory of framed messages)
+    lines = make_lines(messages_count, depth)
+    bodies = [hackathon_protocol.string_to_bytes('\t'.join(str(x) for x in (hackathon_protocol.ORDERBOOK,) + tuple(line)))
+              for line in lines]
+    columns = [[line[n] for line in lines] for n in range(len(lines[0]))]
+    if hackathon_protocol.numpy is not None:
+        columns = [hackathon_protocol.numpy.array(column) for column in columns]  # as server's dataframe columns
+    print("Framing: %d orderbooks, %d levels, %d bytes per text body" % (messages_count, depth, len(bodies[0])))
+
+    for checksum_mode in (hackathon_protocol.CHECKSUM_MD5, hackathon_protocol.CHECKSUM_CRC32, hackathon_protocol.CHECKSUM_NONE):
+        report_per_message(results, "checksum %s" % checksum_mode,
+                           lambda count: [hackathon_protocol.get_hex_checksum(body, checksum_mode) for body in bodies[:count]],
+                           messages_count, repeat)
+        report_per_message(results, "make_raw_message text %s" % checksum_mode,
+                           lambda count: [hackathon_protocol.prepare_orderbook_raw_message(line, checksum_mode)
+                                          for line in lines[:count]],
+                           messages_count, repeat)
+        report_per_message(results, "frame_many text %s" % checksum_mode,
+                           lambda count: hackathon_protocol.frame_many([column[:count] for column in columns],
+                                                                       hackathon_protocol.ORDERBOOK, checksum_mode),
+                           messages_count, repeat)
+        report_per_message(results, "binary orderbook %s" % checksum_mode,
+                           lambda count: [hackathon_protocol.prepare_binary_orderbook_raw_message(line, checksum_mode)
+                                          for line in lines[:count]],
+                           messages_count, repeat)
+        if hackathon_protocol.numpy is not None:
+            report_per_message(results, "binary frame blocks %s" % checksum_mode,
+                               lambda count: list(hackathon_protocol.binary_orderbook_frame_blocks(
+                                   [column[:count] for column in columns], checksum_mode)),
+                               messages_count, repeat)
+
+
+class CountingClient(hackathon_protocol.Client):
+    def __init__(self, sock):
+        super(CountingClient, self).__init__(sock)
+        self.messages_count = 0
+
+    def on_orderbook(self, cvs_line_values):
+        self.messages_count += 1
+
+
+class CountingRowsClient(CountingClient):
+    def on_orderbook_row(self, row):
+        self.messages_count += 1
+
+
+def receive_stream(session, chunks):
+    # run session on in-memory connection that delivers chunks of stream, then closes
+    transport, peer = hackathon_protocol.memory_transport_pair()
+    peer.sendmsg(chunks)
+    peer.close()
+    session.sock = transport
+    session.run()
+
+
+def bench_parse(results, messages_count, repeat, depth):
+    # messages received by client: framing of SessionImpl (with checksum check), then parsing of Client.on_message
+    # (nothing is kept: allocations are temporary, see peak)
+    header = make_header(depth)
+    lines = make_lines(messages_count, depth)
+    text_bodies = ['\t'.join(str(x) for x in (hackathon_protocol.ORDERBOOK,) + tuple(line)) for line in lines]
+    binary_bodies = [memoryview(frame)[hackathon_protocol.PREFIX_LEN:]
+                     for frame in (hackathon_protocol.prepare_binary_orderbook_raw_message(line) for line in lines[:100])]
+    print("Parse: %d orderbooks, %d levels" % (messages_count, depth))
+
+    for checksum_mode in (hackathon_protocol.CHECKSUM_MD5, hackathon_protocol.CHECKSUM_CRC32, hackathon_protocol.CHECKSUM_NONE):
+        frames = make_frames(messages_count, checksum_mode, depth)
+
+        def run_session(count):
+            # stream is delivered in chunks of about 64 KiB, as socket would
+            stream = memoryview(b''.join(frames[:count]))
+            chunk_size = 64 * 1024
+            session = CountingSession(None)
+            session.recv_checksum_mode = checksum_mode
+            receive_stream(session, [stream[n : n + chunk_size] for n in range(0, len(stream), chunk_size)])
+            assert session.messages_count == count
+
+        report_per_message(results, "SessionImpl framing %s" % checksum_mode, run_session, messages_count, repeat)
+
+    def parse_text(client):
+        def parse(count):
+            on_message = client.on_message
+            for body in text_bodies[:count]:
+                on_message(body)
+        return parse
+
+    def parse_binary(client):
+        def parse(count):
+            on_binary_message = client.on_binary_message
+            for n in range(count):
+                on_binary_message(binary_bodies[n % len(binary_bodies)])
+        return parse
+
+    for name, client_class, make_parse in (("on_message text, on_orderbook", CountingClient, parse_text),
+                                           ("on_message text, on_orderbook_row", CountingRowsClient, parse_text),
+                                           ("on_binary_message, on_orderbook", CountingClient, parse_binary),
+                                           ("on_binary_message, on_orderbook_row", CountingRowsClient, parse_binary)):
+        client = client_class(None)
+        client.on_message('\t'.join([hackathon_protocol.HEADER] + header))
+        report_per_message(results, name, make_parse(client), messages_count, repeat)
+
+
+def measure_end_to_end(connect, frames, bursts):
+    # messages per second from server-like sender session (bursts of frames) to client parsing them
+    server_sock, client_sock = connect()
+    sender = CountingSession(server_sock)
+    client = CountingRowsClient(client_sock)
+    thread = threading.Thread(target=client.run)
+    thread.start()
+
+    start = precise_time()
+    n = 0
+    for burst in bursts:
+        for frame in frames[n : n + burst]:
+            sender.send_raw_message(frame)
+        sender.flush_send_queue()
+        n += burst
+    server_sock.close()
+    thread.join()
+    elapsed = precise_time() - start
+    assert client.messages_count == len(frames) - 1
+    return (len(frames) - 1) / elapsed
+
+
+def tcp_loopback_pair():
+    acceptor = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    acceptor.bind(('127.0.0.1', 0))
+    acceptor.listen(1)
+    client_sock = socket.create_connection(acceptor.getsockname())
+    server_sock, address = acceptor.accept()
+    acceptor.close()
+    return server_sock, client_sock
+
+
+def bench_end_to_end(results, messages_count, repeat, bursts, depth):
+    # header, then orderbooks parsed by client into OrderbookRow
+    frames = [hackathon_protocol.prepare_header_raw_message(make_header(depth))] + make_frames(messages_count, depth=depth)
+    bursts = [bursts[0] + 1] + bursts[1:]   # header with the first burst
+    print("End-to-end: %d orderbooks, %.1f per flush" % (messages_count, messages_count / float(len(bursts))))
+    transports = [("TCP loopback", tcp_loopback_pair), ("memory", hackathon_protocol.memory_transport_pair)]
+    if hasattr(socket, 'socketpair'):
+        transports.insert(1, ("socketpair", socket.socketpair))
+    for name, connect in transports:
+        with Quiet():
+            best = max(measure_end_to_end(connect, frames, bursts) for _ in range(repeat))
+        print("  %-16s %12.0f msgs/sec" % (name, best))
+        results['end-to-end ' + name] = OrderedDict([('msgs_per_sec', best)])
+
+
+def compare_results(results, baseline_file):
+    # ratio of every measure to the same measure in baseline JSON (> 1: faster / less memory now)
+    with open(baseline_file) as f:
+        baseline = json.load(f)['results']
+    print("\nCompared with %s:" % baseline_file)
+    for name, measures in results.items():
+        for key, value in measures.items():
+            old = baseline.get(name, {}).get(key)
+            if key not in ('ns_per_msg', 'msgs_per_sec', 'bytes_per_msg') or not old or not value \
+                    or (key == 'bytes_per_msg' and min(old, value) < 1):   # nothing is kept
+                continue
+            ratio = value / old if key == 'msgs_per_sec' else old / value
+            print("  %-48s %-18s %8.2fx" % (name, key, ratio))
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="hackathon_protocol benchmarks")
+    parser.add_argument("--messages", "-m", help="Messages count", type=int, default=MESSAGES_COUNT)
+    parser.add_argument("--repeat", "-r", help="Repeat each measure N times, best is reported", type=int, default=REPEAT)
+    parser.add_argument("--burst", "-b", help="Messages queued before each send flush", type=int, default=BURST_SIZE)
+    parser.add_argument("--burst-pattern", help="Burst sizes: fixed, or random with --burst on average",
+                        choices=BURST_PATTERNS, default=BURST_PATTERN)
+    parser.add_argument("--depth", "-d", help="Orderbook levels (message size)", type=int, default=DEPTH)
+    parser.add_argument("--only", help="Comma separated benchmarks to run: framing,parse,recv,send,end-to-end", default=None)
+    parser.add_argument("--json", help="Save results to JSON file", default=None)
+    parser.add_argument("--compare", help="Compare results with JSON file saved before", default=None)
+
+    args = parser.parse_args()
+
+    bursts = make_bursts(args.messages, args.burst, args.burst_pattern)
+    benchmarks = OrderedDict([
+        ('framing', lambda results: bench_framing(results, args.messages, args.repeat, args.depth)),
+        ('parse', lambda results: bench_parse(results, args.messages, args.repeat, args.depth)),
+        ('recv', lambda results: bench_recv(results, args.messages, args.repeat)),
+        ('send', lambda results: bench_send(results, args.messages, args.repeat, bursts)),
+        ('end-to-end', lambda results: bench_end_to_end(results, args.messages, args.repeat, bursts, args.depth)),
+    ])
+    selected = args.only.split(',') if args.only else list(benchmarks)
+
+    results = OrderedDict()
+    for name in selected:
+        benchmarks[name](results)
+
+    if args.json:
+        params = OrderedDict([('messages', args.messages), ('repeat', args.repeat), ('burst', args.burst),
+                              ('burst_pattern', args.burst_pattern), ('depth', args.depth)])
+        with open(args.json, 'w') as f:
+            json.dump(OrderedDict([('python', sys.version.split()[0]), ('platform', platform.platform()),
+                                   ('time', time.strftime('%Y-%m-%d %H:%M:%S')), ('params', params),
+                                   ('results', results)]), f, indent=2)
+        print("Results saved to", args.json)
+
+    if args.compare:
+        compare_results(results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
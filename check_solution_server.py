@@ -1,14 +1,17 @@
 #!/usr/bin/python
 from __future__ import print_function   # for python 2 compatibility
 import os
-import time
-import sys, hashlib, re
+import time, math
+import sys, hashlib, re, json, shutil, mmap, threading
+from array import array
 import pandas as pd
 import numpy as np
-from sklearn.metrics import mean_squared_error
 
 sys.path.append('solution_example') # folder with hackathon_protocol.py
 import hackathon_protocol
+import session_log
+
+precise_time = getattr(time, 'perf_counter', time.time)  # high resolution timer for response latency
 
 pd.set_option('display.expand_frame_repr', False)
 pd.set_option('display.max_rows', 1000)
@@ -24,9 +27,23 @@ EXPECTED_CVS_ELEMENTS_COUNT = 2 + 4*ORDERBOOK_DEPTH # instrument + time + (price
 HOST = ''
 PORT = 12345
 DATAFILE = None
-TARGET_INSTRUMENT = 'TEA'
+TARGET_INSTRUMENTS = ('TEA',)  # several instruments: PREDICT_NOW messages name instrument to predict
 ENABLE_PROGRESS_BAR = True
 OUTPUT_LOG_DIR = None
+LOG_COMPRESSION = session_log.COMPRESSION_NONE
+ALLOW_NO_CHECKSUM = False
+CACHE_DIR = None    # None: '<DATAFILE>.cache', '': disabled
+MAX_SESSIONS = 1    # sessions evaluated in parallel
+FORK_ON_CONNECT = False
+MAX_PREDICT_BATCH_SIZE = 256   # PREDICT_NOW sent before waiting for answers, if solution asks for batches (0: no batches)
+INTERIM_SCORE_INTERVAL = 10000  # send interim score to user every N answers (0: never)
+RESPONSE_TIMEOUT = 10.0    # seconds to answer PREDICT_NOW, session is stopped if exceeded (0: no limit)
+USE_ASYNCIO = False # serve all sessions in one asyncio event loop (python 3 only)
+UNIX_SOCKET = None  # listen on Unix domain socket at this path instead of TCP port
+IN_PROCESS_CLIENT = None    # python file with solution client evaluated in this process, without sockets
+STAGE_TIMING = False    # measure stages of every response and report where session time goes
+
+CACHE_FORMAT_VERSION = 5
 
 class CheckSolutionServer:
     def __init__(self):
@@ -34,62 +51,200 @@ class CheckSolutionServer:
         self.time0 = time.time()
         self.orderbooks_count = 0
 
-        print("Loading data from '%s'..." % DATAFILE)
-        self.dataframe = pd.read_csv(DATAFILE, sep=';')
-        loaded_items = len(self.dataframe.index)
-        print("Loaded", loaded_items, "items, analyzing data...")
-        self.answers = self.get_answers_and_cut_off_dataframe_tail()
+        self.cache_path = cache_path = self.get_cache_path()
+        if cache_path and os.path.isdir(cache_path):
+            print("Loading cached data from '%s'..." % cache_path)
+            self.dataframe, self.answers, self.answer_instruments, binary_orderbooks_fit = load_dataset_cache(cache_path)
+            print("Loaded", len(self.dataframe.index), "items in %.3f sec" % (time.time() - self.time0))
+        else:
+            print("Loading data from '%s'..." % DATAFILE)
+            self.dataframe = pd.read_csv(DATAFILE, sep=';')
+            loaded_items = len(self.dataframe.index)
+            print("Loaded", loaded_items, "items, analyzing data...")
+            self.answers = self.get_answers_and_cut_off_dataframe_tail()
+
+            # instrument of every answer, as (names, codes): answer n is for instrument names[codes[n]]
+            answer_instruments = self.dataframe[self.dataframe.columns[0]].loc[self.answers.index].to_numpy()
+            names, codes = np.unique(answer_instruments, return_inverse=True)
+            self.answer_instruments = (tuple(names.tolist()), codes)
+            binary_orderbooks_fit = fits_binary_orderbooks(self.dataframe)
+
+            if cache_path:
+                try:
+                    save_dataset_cache(cache_path, self.dataframe, self.answers, self.answer_instruments,
+                                       binary_orderbooks_fit)
+                    print("Data cached at '%s'" % cache_path)
+                except (IOError, OSError) as ex:
+                    # e.g. read-only data directory or full disk: run without cache
+                    print("Data is not cached:", ex)
+                    self.cache_path = None
+
+        # binary orderbooks are offered only if every instrument and time fits into their header
+        self.orderbook_formats = (hackathon_protocol.ORDERBOOK_TEXT, hackathon_protocol.ORDERBOOK_BINARY)
+        if not binary_orderbooks_fit:
+            print("Binary orderbooks are disabled: instruments or times are too long")
+            self.orderbook_formats = (hackathon_protocol.ORDERBOOK_TEXT,)
+
         print("Data analyzed, preparing messages...")
-        self.raw_messages = self.get_raw_messages()
+        self.raw_messages_by_format = {}
+        self.raw_messages_lock = threading.Lock()
+        self.raw_messages = self.get_raw_messages_for(hackathon_protocol.CHECKSUM_MD5, hackathon_protocol.ORDERBOOK_TEXT)
+        self.orderbooks_count = self.raw_messages.count_orderbooks()
         print("Prepared {} orderbooks, {} messages, ".format(self.orderbooks_count, len(self.raw_messages)))
 
+    def get_cache_path(self):
+        # cached data depends on file content and on parameters used to calc answers
+        if CACHE_DIR == '': return None
+        cache_dir = CACHE_DIR if CACHE_DIR is not None else DATAFILE + '.cache'
+        file_hash = get_file_hash(DATAFILE, cache_dir)
+        key = "v%d_%s_%s_h%d_w%d" % (CACHE_FORMAT_VERSION, file_hash, '+'.join(TARGET_INSTRUMENTS),
+                                     PREDICTION_HORIZON, WARMUP_MESSAGES)
+        return os.path.join(cache_dir, key)
+
     def run(self):
-        print("Server listening on port", PORT)
-        hackathon_protocol.tcp_listen(HOST, PORT, self.on_client_connected)
+        if IN_PROCESS_CLIENT:
+            self.run_in_process(IN_PROCESS_CLIENT)
+            return
+
+        print("Server listening on", UNIX_SOCKET if UNIX_SOCKET else "port %d" % PORT)
+        if USE_ASYNCIO:
+            import asyncio, hackathon_protocol_async
+            self.async_sessions_count = 0
+            asyncio.run(hackathon_protocol_async.tcp_listen(
+                HOST, PORT, self.make_async_session, self.on_async_session_finished))
+        elif UNIX_SOCKET:
+            hackathon_protocol.unix_listen(UNIX_SOCKET, self.on_client_connected, MAX_SESSIONS, FORK_ON_CONNECT)
+        else:
+            hackathon_protocol.tcp_listen(HOST, PORT, self.on_client_connected, MAX_SESSIONS, FORK_ON_CONNECT)
+
+    def run_in_process(self, client_file):
+        # evaluate Client subclass from client_file connected by MemoryTransport, both run in this thread
+        from replay_session import load_client_class
+
+        server_transport, client_transport = hackathon_protocol.memory_transport_pair()
+        session = CheckSolutionServer.Session(server_transport, self.raw_messages, self.answers, self.orderbooks_count,
+                                              self.get_raw_messages_for, None, self.answer_instruments,
+                                              self.orderbook_formats)
+        client_path = os.path.abspath(client_file)
+        current_dir = os.getcwd()
+        try:
+            os.chdir(os.path.dirname(client_path))  # client may load model files from current directory
+            sys.path.insert(0, os.path.dirname(client_path))
+            client = load_client_class(client_path)(client_transport)
+            print("Evaluating", type(client).__name__, "from", client_file)
+            hackathon_protocol.run_in_memory([client, session])
+        finally:
+            os.chdir(current_dir)
+            try:
+                session.on_finish()
+            finally:
+                session.save_session_log()
 
     def get_answers_and_cut_off_dataframe_tail(self, period=PREDICTION_HORIZON):
         # calc correct volatility
-        # (shifted to the past to PREDICTION_HORIZON records of TEA)
-        instrument_column_name = list(self.dataframe.columns.values)[0]
-        d = self.dataframe.iloc[WARMUP_MESSAGES:].copy()
-        d = d[d[instrument_column_name] == TARGET_INSTRUMENT]   # only TEA instrument
-
-        if len(d.index) == 0:
-            message = "Instrument '{}' is not found in dataset ".format(TARGET_INSTRUMENT)
-            raise ValueError(message)
-
-        midprice = (d['BID_P_1'] + d['ASK_P_1']) / 2
-        r = midprice.rolling(window=period).std().shift(-(period-1)).dropna()
+        # (shifted to the past to PREDICTION_HORIZON records of every target instrument)
+        answers = calc_answers(self.dataframe, TARGET_INSTRUMENTS, (period,), WARMUP_MESSAGES)
+        r = pd.concat([answers[instrument, period] for instrument in TARGET_INSTRUMENTS]).sort_index()
         last_index = r.index[-1]
-        self.dataframe = self.dataframe.ix[:last_index + 1]  # trim dataframe from the end
+        self.dataframe = self.dataframe.loc[:last_index + 1]  # trim dataframe from the end
         return r
 
-    def get_raw_messages(self):
-        result = []
-
+    def get_raw_messages(self, orderbook_format=hackathon_protocol.ORDERBOOK_TEXT,
+                         checksum_mode=hackathon_protocol.CHECKSUM_MD5):
         header = tuple(self.dataframe.columns.values)
         header = header[:EXPECTED_CVS_ELEMENTS_COUNT] # drop Y column
-        header_msg = hackathon_protocol.prepare_header_raw_message(header)
-        predict_msg = hackathon_protocol.prepare_predict_now_raw_message()
-
-        result.append((False, header_msg))
-
-        for tt in self.dataframe.itertuples():
-            #if n > 100000: break
-            n, csv_items = tt[0], tt[1:]
-            csv_items = csv_items[:EXPECTED_CVS_ELEMENTS_COUNT]  # prevent sending answer if it is present
-            instrument = csv_items[0]
-            need_response = n > WARMUP_MESSAGES and instrument == TARGET_INSTRUMENT
-            raw_msg = hackathon_protocol.prepare_orderbook_raw_message(csv_items)
-            result.append((False, raw_msg))
-            self.orderbooks_count += 1
-            if need_response:
-                result.append((True, predict_msg))
-        return result
+        header_msg = hackathon_protocol.prepare_header_raw_message(header, checksum_mode)
+        columns = [self.dataframe[column_name] for column_name in header]
+
+        if orderbook_format == hackathon_protocol.ORDERBOOK_BINARY:
+            blocks = hackathon_protocol.binary_orderbook_frame_blocks(columns, checksum_mode)
+        else:
+            blocks = hackathon_protocol.frame_blocks(columns, hackathon_protocol.ORDERBOOK, checksum_mode)
+
+        # PREDICT_NOW after orderbooks we wait response for (its frame, None for other orderbooks)
+        if len(TARGET_INSTRUMENTS) > 1:
+            # orderbooks we have answers for, PREDICT_NOW names the instrument
+            instrument_names, answer_instrument_codes = self.answer_instruments
+            predict_msgs = np.array([hackathon_protocol.prepare_predict_now_raw_message(checksum_mode, instrument)
+                                     for instrument in instrument_names], dtype=object)
+            need_responses = self.dataframe.index.isin(self.answers.index)
+            response_frames = predict_msgs[answer_instrument_codes]
+        else:
+            # orderbooks of the instrument after warmup, single instrument sessions are scored as they always were
+            instruments, target = columns[0].to_numpy(), TARGET_INSTRUMENTS[0]
+            if instruments.dtype.kind == 'S':
+                target = target.encode('utf-8')     # text column from dataset cache
+            need_responses = (self.dataframe.index > WARMUP_MESSAGES) & (instruments == target)
+            response_frames = hackathon_protocol.prepare_predict_now_raw_message(checksum_mode)
+        predict_frames = np.full(len(need_responses), None, dtype=object)
+        predict_frames[need_responses] = response_frames
+        predict_lengths = np.zeros(len(need_responses), dtype=np.int64)
+        predict_lengths[need_responses] = [len(frame) for frame in predict_frames[need_responses]]
+
+        # header, then orderbooks, PREDICT_NOW after orderbooks we wait response for,
+        # every block of frames is interleaved with its PREDICT_NOW and appended to one buffer
+        buffer = bytearray(header_msg)
+        offsets = array('q', [0, len(buffer)])
+        flags = bytearray([0])
+
+        begin = 0
+        for frames, lengths in blocks:
+            end = begin + len(frames)
+            need = need_responses[begin:end]
+
+            pieces = np.empty(2 * len(frames), dtype=object)   # orderbook, then PREDICT_NOW or b''
+            pieces[0::2] = frames
+            pieces[1::2] = b''
+            pieces[1::2][need] = predict_frames[begin:end][need]
+            piece_lengths = np.zeros(len(pieces), dtype=np.int64)
+            piece_lengths[0::2] = lengths
+            piece_lengths[1::2] = predict_lengths[begin:end]
+
+            is_message = piece_lengths > 0
+            buffer += b''.join(pieces[is_message].tolist())
+            offsets.extend((np.cumsum(piece_lengths[is_message]) + offsets[-1]).tolist())
+            flags += (np.arange(len(pieces)) % 2)[is_message].astype(np.uint8).tobytes()
+            begin = end
+
+        return RawMessages(buffer, offsets, flags)
+
+    def get_raw_messages_for(self, checksum_mode, orderbook_format):
+        # messages are prepared once for every checksum mode and orderbook format,
+        # with cache enabled they are saved to file and used from memory mapped file
+        if checksum_mode == hackathon_protocol.CHECKSUM_NONE:
+            checksum_mode = hackathon_protocol.CHECKSUM_MD5  # client does not check checksum at all
+
+        key = (checksum_mode, orderbook_format)
+        with self.raw_messages_lock:    # sessions may run in parallel threads
+            if key not in self.raw_messages_by_format:
+                self.raw_messages_by_format[key] = self.load_or_prepare_raw_messages(checksum_mode, orderbook_format)
+            return self.raw_messages_by_format[key]
+
+    def load_or_prepare_raw_messages(self, checksum_mode, orderbook_format):
+        key = (checksum_mode, orderbook_format)
+        path = os.path.join(self.cache_path, "messages_%s_%s" % key) if self.cache_path else None
+
+        if path and RawMessages.exists(path):
+            raw_messages = RawMessages.load(path)
+        else:
+            print("Preparing messages with {} checksum, {} orderbooks...".format(checksum_mode, orderbook_format))
+            raw_messages = self.get_raw_messages(orderbook_format, checksum_mode)
+
+            if path:
+                try:
+                    raw_messages.save(path)
+                    raw_messages = RawMessages.load(path)
+                except (IOError, OSError) as ex:
+                    print("Messages are not cached:", ex)
+
+        return raw_messages
 
     class Session(hackathon_protocol.Server):
-        def __init__(self, sock, raw_messages, correct_answers, orderbooks_count):
+        def __init__(self, sock, raw_messages, correct_answers, orderbooks_count, get_raw_messages_for=None,
+                     session_id=None, answer_instruments=None, orderbook_formats=None):
             super(CheckSolutionServer.Session, self).__init__(sock)
+            if orderbook_formats is not None:
+                self.allowed_orderbook_formats = orderbook_formats
             self.counter = 0
             self.orderbooks_count = orderbooks_count
             self.username = None
@@ -97,12 +252,40 @@ class CheckSolutionServer:
             self.raw_messages = raw_messages
             self.start_time = time.time()
             self.volatility_responses_count = 0
-            self.users_answers = []
-            self.correct_answers = correct_answers
+            self.correct_answers = np.asarray(correct_answers, dtype=np.float64)
+            self.squared_error_sum = 0.0    # of answers compared with correct_answers so far
+            self.interim_score_interval = INTERIM_SCORE_INTERVAL
+            self.max_predict_batch_size = MAX_PREDICT_BATCH_SIZE
+            self.predict_requests_count = 0     # PREDICT_NOW sent, id of the next one in batch mode
+            self.predict_batch_pending = 0      # batch mode: PREDICT_NOW sent after previous PREDICT_BATCH
+
+            # per instrument scores, if several instruments are evaluated
+            self.instrument_names, self.answer_instrument_codes = answer_instruments or ((), None)
+            self.instrument_squared_error_sums = [0.0] * len(self.instrument_names)
+            self.instrument_answers_counts = [0] * len(self.instrument_names)
             self.expected_item_num = None
             self.on_finish_called = False
             self.output_log_dir = OUTPUT_LOG_DIR
-            self.session_log = []
+            self.get_raw_messages_for = get_raw_messages_for
+            self.session_id = session_id    # set if several sessions run in parallel
+            self.response_timeout = RESPONSE_TIMEOUT
+            self.response_latencies = array('d')    # seconds from PREDICT_NOW to VOLATILITY
+            self.start_time_we_wait_user_response_from = None
+
+            # seconds of every response stage, client stages are known if client sends STAGE_TIMES
+            self.stage_timing = STAGE_TIMING
+            self.stage_times = dict((stage, array('d')) for stage in ('prepare', 'wait', 'parse', 'predict', 'score'))
+            self.prepare_start_time = None  # when send_next() started to prepare messages to answer
+            self.send_time = None           # when sending of them started
+            self.answer_time = None         # when the last answer was received
+
+            if ALLOW_NO_CHECKSUM:
+                self.allowed_checksum_modes += (hackathon_protocol.CHECKSUM_NONE,)
+
+            # session log is written to file while session runs, renamed when username is known
+            self.log_writer = None
+            if self.output_log_dir:
+                self.log_writer = session_log.SessionLogWriter(self.get_session_log_filename(None), LOG_COMPRESSION)
 
         def is_log_enabled(self): return False
 
@@ -112,54 +295,159 @@ class CheckSolutionServer:
                 self.log_message("Unexpecting logon. Ignoring.")
                 return
 
-            print("LOGIN '{}' '{}'".format(username, pass_hash))
+            self.print_message("LOGIN '{}' '{}', checksum: {}, orderbooks: {}, predict batch: {}".format(
+                username, pass_hash, self.send_checksum_mode, self.orderbook_format, self.predict_batch_size))
 
             self.start_time_we_wait_user_response_from = None
             self.counter = 0
             self.username = username
             self.pass_hash = pass_hash
+
+            if self.get_raw_messages_for:
+                self.raw_messages = self.get_raw_messages_for(self.send_checksum_mode, self.orderbook_format)
+
             self.send_next()
 
         def on_volatility(self, volatility):
 
-            if self.expected_item_num is None:
+            if self.expected_item_num is None or self.predict_batch_size or self.is_not_waiting():
                 # we do not expect volatility right now
                 return
 
-            self.start_time_we_wait_user_response_from = None
+            if not self.check_response_latency():
+                return
 
-            self.volatility_responses_count += 1
-            # remember answer to item_num's response
-            self.users_answers.append((self.expected_item_num, volatility))
+            self.add_answer(volatility)
             self.expected_item_num = None
             self.send_next()
 
+        def on_volatility_batch(self, first_prediction_id, volatilities):
+
+            if self.expected_item_num is None or not self.predict_batch_size or self.is_not_waiting():
+                # we do not expect volatility batch right now
+                return
+
+            if not self.check_response_latency():
+                return
+
+            if first_prediction_id != self.volatility_responses_count or len(volatilities) != self.predict_batch_pending:
+                self.log_message("Unexpected VOLATILITY_BATCH: ids {}..{} (expected: {}..{})".format(
+                    first_prediction_id, first_prediction_id + len(volatilities) - 1,
+                    self.volatility_responses_count, self.volatility_responses_count + self.predict_batch_pending - 1))
+                self.stop()
+                return
+
+            for volatility in volatilities:
+                self.add_answer(volatility)
+            self.predict_batch_pending = 0
+            self.expected_item_num = None
+            self.send_next()
+
+        def on_stage_times(self, parse_time, predict_time):
+            # client's times of the last answer
+            if not self.stage_timing or len(self.stage_times['parse']) >= len(self.stage_times['wait']):
+                return
+            self.stage_times['parse'].append(parse_time)
+            self.stage_times['predict'].append(predict_time)
+
+        def is_not_waiting(self):
+            # session is stopped (e.g. answer was late), next messages received with the late one are ignored
+            return self.stopped or self.start_time_we_wait_user_response_from is None
+
+        def check_response_latency(self):
+            # remember latency of response, stop session if it's too late
+            answer_time = precise_time()
+            latency = answer_time - self.start_time_we_wait_user_response_from
+            if self.stage_timing:
+                # frames queued by send_next() are sent by flush_send_queue() (queued time is used with asyncio)
+                send_time = self.send_time if self.send_time is not None else self.start_time_we_wait_user_response_from
+                self.stage_times['prepare'].append(send_time - self.prepare_start_time)
+                self.stage_times['wait'].append(answer_time - send_time)
+                self.send_time, self.answer_time = None, answer_time
+            self.start_time_we_wait_user_response_from = None
+            if self.response_timeout and latency > self.response_timeout:
+                self.user_response_timeout(latency)
+                return False
+            self.response_latencies.append(latency)
+            return True
+
+        def add_answer(self, volatility):
+            # n-th answer is compared with n-th correct answer
+            n = self.volatility_responses_count
+            if n < len(self.correct_answers):
+                error = volatility - self.correct_answers[n]
+                self.squared_error_sum += error * error
+                if len(self.instrument_names) > 1:
+                    code = self.answer_instrument_codes[n]
+                    self.instrument_squared_error_sums[code] += error * error
+                    self.instrument_answers_counts[code] += 1
+            self.volatility_responses_count += 1
+
+            if self.interim_score_interval and self.volatility_responses_count % self.interim_score_interval == 0:
+                rmse = self.get_rmse()
+                self.send_interim_score(self.volatility_responses_count, time.time() - self.start_time,
+                                        10.0 / rmse if rmse > 0 else 0.0)
+
         def log(self, is_send, raw_message):
-            self.session_log.append((time.time(), is_send, raw_message))
+            if self.log_writer is not None:
+                self.log_writer.write(is_send, raw_message)
+
+        def flush_send_queue(self):
+            if self.stage_timing and self.send_queue and self.send_time is None \
+                    and self.start_time_we_wait_user_response_from is not None:
+                self.send_time = precise_time()
+            super(CheckSolutionServer.Session, self).flush_send_queue()
 
         def send_next(self):
+            start_time = precise_time()
             N = len(self.raw_messages)
             while True:
                 if self.counter < N:
                     need_response, raw_message = self.raw_messages[self.counter]
                     item_num = self.counter
-                    self.send_raw_message(raw_message)
+                    if need_response and self.predict_batch_size:
+                        # PREDICT_NOW with instrument and prediction id instead of prepared one
+                        prediction_id = self.predict_requests_count
+                        instrument = self.instrument_names[self.answer_instrument_codes[prediction_id]]
+                        self.send_message((hackathon_protocol.PREDICT_NOW, instrument, prediction_id))
+                    else:
+                        self.send_raw_message(raw_message)
                     self.counter += 1
 
                     if self.counter % 20000 == 0:
                         self.report_progress(self.counter, N)
 
                     if need_response:
-                        # wait user's response for this orderbook
-                        self.expected_item_num = item_num
-                        self.start_time_we_wait_user_response_from = time.time()
+                        self.predict_requests_count += 1
+                        if self.predict_batch_size:
+                            self.predict_batch_pending += 1
+                            if self.predict_batch_pending < self.predict_batch_size:
+                                continue
+                            self.send_message(hackathon_protocol.PREDICT_BATCH)
+
+                        # wait user's response for this orderbook (or batch)
+                        self.wait_user_response(item_num, start_time)
                         break
+                elif self.predict_batch_pending:
+                    # last batch is not full
+                    self.send_message(hackathon_protocol.PREDICT_BATCH)
+                    self.wait_user_response(self.counter - 1, start_time)
+                    break
                 else:
                     self.report_progress(N, N)
                     self.on_finish()
                     self.stop()  # stop current session
                     break
 
+        def wait_user_response(self, item_num, send_next_start_time):
+            self.expected_item_num = item_num
+            self.start_time_we_wait_user_response_from = precise_time()
+            if self.stage_timing:
+                # previous answer is scored before send_next()
+                if self.answer_time is not None:
+                    self.stage_times['score'].append(send_next_start_time - self.answer_time)
+                self.prepare_start_time = send_next_start_time
+
         def on_finish(self):
             if self.on_finish_called: return
             elapsed_time = time.time() - self.start_time
@@ -167,8 +455,24 @@ class CheckSolutionServer:
 
             self.log_message("\nSCORE %.3f, time: %.3f sec, %d orderbooks sent, %d responses processed"\
                              % (score, elapsed_time, self.counter, self.volatility_responses_count))
+            self.log_message("%d messages sent, %.4f send syscalls per message"\
+                             % (self.messages_sent, self.get_send_syscalls_per_message()))
+
+            if len(self.instrument_names) > 1:
+                for code, instrument in enumerate(self.instrument_names):
+                    count = self.instrument_answers_counts[code]
+                    rmse = math.sqrt(self.instrument_squared_error_sums[code] / count) if count > 0 else 0.0
+                    self.log_message("SCORE %s %.3f, %d responses processed" % (instrument, 10.0 / rmse if rmse > 0 else 0.0, count))
+
+            latency_percentiles = self.get_latency_percentiles()
+            if latency_percentiles:
+                self.log_message("Response latency p50: %.3f ms, p90: %.3f ms, p99: %.3f ms, max: %.3f ms"\
+                                 % tuple(1000.0 * v for v in latency_percentiles))
+
+            if self.stage_timing:
+                self.log_stage_times(elapsed_time)
 
-            self.send_score(self.counter, elapsed_time, score)
+            self.send_score(self.counter, elapsed_time, score, latency_percentiles)
             self.save_session_log()
             self.on_finish_called = True
 
@@ -177,58 +481,111 @@ class CheckSolutionServer:
             print_progress_bar(current, total)
 
         def user_response_timeout(self, timeout):
-            self.log_message("Response timeout {} ".format(timeout))
+            # late answer (or waiting without answer) is a latency sample too, user gets SCORE before disconnect
+            self.log_message("Response timeout {:.3f} sec (limit: {} sec)".format(timeout, self.response_timeout))
+            self.response_latencies.append(timeout)
+            self.start_time_we_wait_user_response_from = None
+            self.expected_item_num = None
+            self.predict_batch_pending = 0
+            self.on_finish()
             self.stop()
 
+        def on_socket_timeout(self):
+            # nothing received for a while: check if user's response is late
+            if self.start_time_we_wait_user_response_from is None or not self.response_timeout:
+                return
+            waiting = precise_time() - self.start_time_we_wait_user_response_from
+            if waiting > self.response_timeout:
+                self.start_time_we_wait_user_response_from = None
+                self.user_response_timeout(waiting)
+
+        def get_latency_percentiles(self):
+            # (p50, p90, p99, max) of response latencies in seconds, () if there were no responses
+            if not self.response_latencies:
+                return ()
+            latencies = np.frombuffer(self.response_latencies, dtype=np.float64)
+            return tuple(np.percentile(latencies, [50, 90, 99])) + (latencies.max(),)
+
+        def get_stage_rows(self):
+            # (stage name, seconds of every response) in order of a response
+            times = dict((stage, np.frombuffer(values, dtype=np.float64)) for stage, values in self.stage_times.items())
+            wait, n = times['wait'], len(times['parse'])
+            rows = [("server: prepare messages", times['prepare'])]
+            if n > 0 and n >= len(wait) - 1:  # STAGE_TIMES of the last answer come after on_finish()
+                # client receives and parses messages while server still sends them, so it's one stage until last recv
+                rows += [("send, network, client recv", wait[:n] - times['parse'] - times['predict']),
+                         ("client: parse last data", times['parse']),
+                         ("client: make_prediction", times['predict'])]
+            else:
+                # client does not send STAGE_TIMES (stage_timing is not set)
+                rows.append(("send, network, client", wait))
+            rows.append(("server: score answer", times['score']))
+            return rows
+
+        def log_stage_times(self, elapsed_time):
+            # where session time goes: total and per response time of every stage
+            self.log_message("%-26s %9s %10s %6s %10s %10s %10s" % ("stage", "responses", "total ms", "share",
+                                                                    "mean us", "p50 us", "p99 us"))
+            stages_time = 0.0
+            for name, times in self.get_stage_rows():
+                if not len(times): continue
+                total = times.sum()
+                stages_time += total
+                p50, p99 = np.percentile(times, [50, 99])
+                self.log_message("%-26s %9d %10.1f %5.1f%% %10.1f %10.1f %10.1f" % (name, len(times), 1000.0 * total,
+                                 100.0 * total / elapsed_time, 1e6 * times.mean(), 1e6 * p50, 1e6 * p99))
+            rest = max(elapsed_time - stages_time, 0.0)
+            self.log_message("%-26s %9s %10.1f %5.1f%%" % ("(login, finish, other)", "", 1000.0 * rest, 100.0 * rest / elapsed_time))
+
         def log_message(self, message):
-            print(message)
-            self.session_log.append((time.time(), None, message))
+            self.print_message(message)
+            if self.log_writer is not None:
+                self.log_writer.write(None, message)
+
+        def print_message(self, message):
+            if self.session_id is None:
+                print(message)
+            else:
+                print("[{}] {}".format(self.session_id, message.lstrip('\n')))
+
+        def get_rmse(self):
+            # root mean squared error of answers received so far
+            n = min(self.volatility_responses_count, len(self.correct_answers))
+            return math.sqrt(self.squared_error_sum / n) if n > 0 else 0.0
 
         def calc_score(self):
-            ua = self.users_answers
-            a = self.correct_answers
-            b = pd.Series([i[1] for i in ua], index=[i[0] for i in ua])
+            answers_count, expected_count = self.volatility_responses_count, len(self.correct_answers)
             delta = 10
-            if abs(len(a) - len(b)) < delta: # dont care if difference is small
-                a = a[:min(len(a), len(b))]
-                b = b[:min(len(a), len(b))]
-
-                mse = np.sqrt(mean_squared_error(a, b))
-                if mse > 0:
-                    return 10.0 / mse
+            if abs(expected_count - answers_count) < delta: # dont care if difference is small
+                rmse = self.get_rmse()
+                if rmse > 0:
+                    return 10.0 / rmse
 
                 self.log_message('Mse is zero. Score=0')
             else:
-                self.log_message('Incorrect number of user answers {} (expected: {}). Score=0'.format(len(b), len(a)))
+                self.log_message('Incorrect number of user answers {} (expected: {}). Score=0'.format(answers_count, expected_count))
 
             return 0.0
 
-        def save_session_log(self):
-            #print("save_session_log({})".format(self.output_log_dir))
-            if not self.output_log_dir: return
-            if self.on_finish_called: return
-
-            def get_msecs_str(t):
-                return "%03d" % (round(t*1000) % 1000)
+        def get_session_log_filename(self, username):
+            # username is None while session runs
+            timestamp = time.strftime('%Y%m%d-%H%M%S-', time.localtime(self.start_time)) \
+                        + "%03d" % (round(self.start_time*1000) % 1000)
+            name = timestamp if username is None else "%s_%s" % (timestamp, username)
+            if self.session_id is not None:
+                name += "_" + self.session_id.replace(':', '-').replace('#', '')
+            extension = ".hlog" + session_log.COMPRESSION_EXTENSIONS[LOG_COMPRESSION]
+            return os.path.join(self.output_log_dir, name + (extension if username is not None else extension + ".part"))
 
-            username = self.username or "unknown"
-            timestamp = time.strftime('%Y%m%d-%H%M%S-', time.localtime(self.start_time)) + get_msecs_str(self.start_time)
-            filename = os.path.join(self.output_log_dir, "%s_%s.log" % (timestamp, username))
-
-            with open(filename, 'w') as output:
-                for t, is_send, raw_message in self.session_log:
-                    output.write(time.strftime('%Y.%m.%d %H:%M:%S.', time.localtime(t)) + get_msecs_str(t))
-
-                    if is_send: output.write(" [SENT] ")
-                    elif is_send is not None: output.write(" [RECV] ")
-                    else: output.write("        ")
-
-                    if isinstance(raw_message, str): output.write(raw_message)
-                    else: output.write(hackathon_protocol.bytes_to_string(raw_message))
-
-                    output.write('\n')
+        def save_session_log(self):
+            # finish writing session log (see session_log.py to convert it to text)
+            if self.log_writer is None: return
+            log_writer, self.log_writer = self.log_writer, None
+            log_writer.close()
 
-            print("Log file saved at", filename)
+            filename = self.get_session_log_filename(self.username or "unknown")
+            os.rename(log_writer.filename, filename)
+            self.print_message("Log file saved at " + filename)
 
         def try_read_pid_file(self):
 
@@ -260,7 +617,10 @@ class CheckSolutionServer:
 
     def on_client_connected(self, sock, address):
 
-        session = CheckSolutionServer.Session(sock, self.raw_messages, self.answers, self.orderbooks_count)
+        session_id = "%s:%d" % address[:2] if MAX_SESSIONS > 1 else None
+        session = CheckSolutionServer.Session(sock, self.raw_messages, self.answers, self.orderbooks_count,
+                                              self.get_raw_messages_for, session_id, self.answer_instruments,
+                                              self.orderbook_formats)
 
         try:
             session.run()
@@ -268,6 +628,259 @@ class CheckSolutionServer:
         finally:
             session.save_session_log()
 
+    def make_async_session(self):
+        import hackathon_protocol_async
+        self.async_sessions_count += 1
+        session_class = hackathon_protocol_async.get_async_session_class(CheckSolutionServer.Session)
+        return session_class(None, self.raw_messages, self.answers, self.orderbooks_count,
+                             self.get_raw_messages_for, "#%d" % self.async_sessions_count, self.answer_instruments,
+                             self.orderbook_formats)
+
+    def on_async_session_finished(self, session):
+        try:
+            session.on_finish()
+        finally:
+            session.save_session_log()
+
+
+class RawMessages(object):
+    """
+    Framed messages one after another in a single buffer, plus offsets and need_response flags.
+    Works as read-only list of (need_response, raw_message), raw_message is a memoryview of the buffer,
+    so messages are sent to socket without copying. Buffer may be a memory mapped file (see save() and load()).
+    """
+    def __init__(self, buffer, offsets, flags):
+        self.buffer = buffer
+        self.view = memoryview(buffer)
+        self.offsets = offsets      # array('q'), offsets[n]:offsets[n + 1] is n-th message
+        self.flags = bytes(flags)   # need_response for every message
+
+    def __len__(self):
+        return len(self.flags)
+
+    def __getitem__(self, n):
+        return self.flags[n] == 1, self.view[self.offsets[n] : self.offsets[n + 1]]
+
+    def __iter__(self):
+        for n in range(len(self)):
+            yield self[n]
+
+    def count_orderbooks(self):
+        # header, then orderbooks, some of them followed by PREDICT_NOW
+        return len(self) - 1 - self.flags.count(b'\x01')
+
+    def save(self, path):
+        # every file is written under temporary name and renamed, so processes preparing the same messages
+        # do not overwrite files mapped by others, flags are renamed last
+        tmp_suffix = '.tmp%d' % os.getpid()
+        try:
+            with open(path + '.bin' + tmp_suffix, 'wb') as f:
+                f.write(self.view)
+
+            with open(path + '.offsets' + tmp_suffix, 'wb') as f:
+                self.offsets.tofile(f)
+
+            with open(path + '.flags' + tmp_suffix, 'wb') as f:
+                f.write(self.flags)
+        except (IOError, OSError):
+            for extension in ('.bin', '.offsets', '.flags'):
+                if os.path.exists(path + extension + tmp_suffix):
+                    os.remove(path + extension + tmp_suffix)
+            raise
+
+        for extension in ('.bin', '.offsets', '.flags'):
+            os.rename(path + extension + tmp_suffix, path + extension)
+
+    @staticmethod
+    def exists(path):
+        return os.path.isfile(path + '.flags')    # written last
+
+    @staticmethod
+    def load(path):
+        with open(path + '.bin', 'rb') as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        offsets = array('q')
+        with open(path + '.offsets', 'rb') as f:
+            offsets.fromfile(f, os.path.getsize(path + '.offsets') // offsets.itemsize)
+
+        with open(path + '.flags', 'rb') as f:
+            flags = f.read()
+
+        return RawMessages(buffer, offsets, flags)
+
+
+ROLLING_BLOCK_SIZE = 4096  # windows per block of rolling_std_many(), sums are restarted every block
+ROLLING_STRIDED_MAX_WINDOW = 32 # smaller windows are calculated directly (two-pass std over strided view)
+
+
+def rolling_std_many(values, windows, ddof=1):
+    """
+    Standard deviation of every window of consecutive values, for several window sizes at once:
+        result[window][i] == np.std(values[i : i + window], ddof=ddof)
+    Window sums come from cumulative sums of values minus the block mean; sums are restarted every
+    ROLLING_BLOCK_SIZE windows, so their magnitude (and rounding error) does not grow with data length.
+    Cancellation in sum(y^2) - sum(y)^2/window is worst for short windows, they are calculated
+    by two-pass std over a strided (not copied) view of the windows instead.
+    """
+    x = np.asarray(values, dtype=np.float64)
+    windows = sorted(set(windows))
+    max_window = windows[-1]
+    result = {}
+    for window in windows:
+        assert window > ddof
+        result[window] = np.empty(max(len(x) - window + 1, 0))
+
+    for begin in range(0, max(len(x) - windows[0] + 1, 0), ROLLING_BLOCK_SIZE):
+        block = x[begin : begin + ROLLING_BLOCK_SIZE + max_window - 1]
+        y = block - block.mean()
+        sum1 = np.concatenate(([0.0], np.cumsum(y)))
+        sum2 = np.concatenate(([0.0], np.cumsum(y * y)))
+        for window in windows:
+            out = result[window][begin : begin + ROLLING_BLOCK_SIZE]
+            if len(out) == 0: continue
+            if window <= ROLLING_STRIDED_MAX_WINDOW:
+                view = np.lib.stride_tricks.as_strided(block, shape=(len(out), window), strides=block.strides * 2)
+                out[:] = view.std(axis=1, ddof=ddof)
+                continue
+            s1 = sum1[window : window + len(out)] - sum1[:len(out)]
+            s2 = sum2[window : window + len(out)] - sum2[:len(out)]
+            m2 = s2 - s1 * s1 / window
+            np.sqrt(np.maximum(m2, 0.0) / (window - ddof), out=out)
+
+    return result
+
+
+def rolling_std(values, window, ddof=1):
+    return rolling_std_many(values, (window,), ddof)[window]
+
+
+def calc_answers(dataframe, instruments, horizons, warmup=WARMUP_MESSAGES):
+    """
+    Correct volatility answers for every instrument and prediction horizon:
+    { (instrument, horizon): pd.Series }, answer for orderbook is the std of mid prices of this
+    and next (horizon - 1) orderbooks of the same instrument, Series index is dataframe index of orderbook.
+    Orderbooks before warmup row are skipped.
+    """
+    instrument_column = dataframe[dataframe.columns[0]].to_numpy()
+    mid_prices = (dataframe['BID_P_1'].to_numpy(dtype=np.float64) + dataframe['ASK_P_1'].to_numpy(dtype=np.float64)) / 2
+    answers = {}
+    for instrument in instruments:
+        positions = np.flatnonzero(instrument_column[warmup:] == instrument) + warmup
+        if len(positions) == 0:
+            raise ValueError("Instrument '{}' is not found in dataset ".format(instrument))
+        if len(positions) < max(horizons):
+            raise ValueError("Instrument '{}' has only {} orderbooks".format(instrument, len(positions)))
+
+        index = dataframe.index[positions]
+        for horizon, std in rolling_std_many(mid_prices[positions], horizons).items():
+            answers[instrument, horizon] = pd.Series(std, index=index[:len(std)])
+    return answers
+
+
+def fits_binary_orderbooks(dataframe):
+    # instrument and time of every orderbook fit into binary orderbook header
+    instruments, times = dataframe[dataframe.columns[0]].unique().tolist(), dataframe[dataframe.columns[1]].tolist()
+    longest = lambda values: max(values, key=lambda value: len(str(value))) if values else ''
+    return hackathon_protocol.fits_binary_orderbook_header(longest(instruments), longest(times))
+
+
+def get_file_hash(filename, cache_dir=None):
+    # sha1 of file content; with cache_dir it is kept in '<cache_dir>/file_hashes.json'
+    # and reused while the file has the same size and modification time
+    stat = os.stat(filename)
+    key, signature = os.path.abspath(filename), [stat.st_size, stat.st_mtime]
+    hashes_path = os.path.join(cache_dir, 'file_hashes.json') if cache_dir else None
+    hashes = {}
+    if hashes_path and os.path.isfile(hashes_path):
+        try:
+            with open(hashes_path) as f:
+                hashes = json.load(f)
+        except ValueError:
+            hashes = {}     # damaged file: hash again
+        if hashes.get(key, [])[:2] == signature:
+            return hashes[key][2]
+
+    sha1 = hashlib.sha1()
+    with open(filename, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024*1024), b''):
+            sha1.update(chunk)
+    file_hash = sha1.hexdigest()[:16]
+
+    if hashes_path:
+        hashes[key] = signature + [file_hash]
+        try:
+            if not os.path.isdir(cache_dir):
+                os.makedirs(cache_dir)
+            tmp_path = hashes_path + '.tmp%d' % os.getpid()
+            with open(tmp_path, 'w') as f:
+                json.dump(hashes, f)
+            os.rename(tmp_path, hashes_path)
+        except (IOError, OSError):
+            pass    # read-only cache directory: hash file every time
+    return file_hash
+
+
+def save_dataset_cache(cache_path, dataframe, answers, answer_instruments, binary_orderbooks_fit):
+    # one .npy file per column (text columns as fixed width utf-8 bytes), so loading is just mmap
+    tmp_path = cache_path + '.tmp%d' % os.getpid()
+    try:
+        write_dataset_cache(tmp_path, dataframe, answers, answer_instruments, binary_orderbooks_fit)
+    except (IOError, OSError):
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        raise
+
+    try:
+        os.rename(tmp_path, cache_path)   # other server may have made the same cache already
+    except OSError:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+
+
+def write_dataset_cache(tmp_path, dataframe, answers, answer_instruments, binary_orderbooks_fit):
+    os.makedirs(tmp_path)
+
+    columns = []
+    for n, column_name in enumerate(dataframe.columns.values):
+        column = dataframe[column_name]
+        if pd.api.types.is_numeric_dtype(column):
+            values = column.to_numpy()
+        else:
+            values = np.char.encode(column.to_numpy().astype(str), 'utf-8')
+        np.save(os.path.join(tmp_path, 'column%d.npy' % n), values)
+        columns.append(column_name)
+
+    instrument_names, answer_instrument_codes = answer_instruments
+    np.save(os.path.join(tmp_path, 'index.npy'), dataframe.index.values)
+    np.save(os.path.join(tmp_path, 'answers_index.npy'), answers.index.values)
+    np.save(os.path.join(tmp_path, 'answers.npy'), answers.values)
+    np.save(os.path.join(tmp_path, 'answer_instrument_codes.npy'), answer_instrument_codes)
+
+    with open(os.path.join(tmp_path, 'dataset.json'), 'w') as f:
+        json.dump({'columns': columns, 'instrument_names': list(instrument_names),
+                   'binary_orderbooks_fit': bool(binary_orderbooks_fit)}, f)
+
+
+def load_dataset_cache(cache_path):
+    # returns dataframe, answers, answer_instruments and binary_orderbooks_fit, nothing is copied:
+    # columns stay in memory mapped files, text columns as numpy bytes
+    def load(name):
+        return np.load(os.path.join(cache_path, name), mmap_mode='r')
+
+    with open(os.path.join(cache_path, 'dataset.json')) as f:
+        dataset = json.load(f)
+    columns = dataset['columns']
+    numpy_array = getattr(pd.arrays, 'NumpyExtensionArray', None) or pd.arrays.PandasArray  # pandas < 2.1
+
+    data = {}
+    for n, column_name in enumerate(columns):
+        values = load('column%d.npy' % n)
+        data[column_name] = numpy_array(values) if values.dtype.kind == 'S' else values
+
+    dataframe = pd.DataFrame(data, index=load('index.npy'), columns=columns, copy=False)
+    answers = pd.Series(load('answers.npy'), index=load('answers_index.npy'), copy=False)
+    answer_instruments = (tuple(dataset['instrument_names']), load('answer_instrument_codes.npy'))
+    return dataframe, answers, answer_instruments, dataset['binary_orderbooks_fit']
+
 
 def print_progress_bar(iteration, total):
     if not ENABLE_PROGRESS_BAR: return
@@ -284,7 +897,8 @@ def print_progress_bar(iteration, total):
 
 def main():
     global DATAFILE, HOST, PORT, FORK_ON_CONNECT, ENABLE_PROGRESS_BAR, \
-        OUTPUT_LOG_DIR, TARGET_INSTRUMENT
+        OUTPUT_LOG_DIR, LOG_COMPRESSION, TARGET_INSTRUMENTS, ALLOW_NO_CHECKSUM, CACHE_DIR, MAX_SESSIONS, USE_ASYNCIO, RESPONSE_TIMEOUT, \
+        INTERIM_SCORE_INTERVAL, MAX_PREDICT_BATCH_SIZE, UNIX_SOCKET, IN_PROCESS_CLIENT, STAGE_TIMING
 
     import argparse
 
@@ -292,18 +906,61 @@ def main():
     parser.add_argument("datafile", help="CSV data file", default="data/training.csv", nargs='?')
     parser.add_argument("--host", "-ip", help="server listen ip", default='0.0.0.0')
     parser.add_argument("--port", "-p", help="server listen port", type=int, default=12345)
-    parser.add_argument("--instrument", "-i", help="Target instrument we calculation volatility for", default="TEA")
+    parser.add_argument("--unix-socket", help="Listen on Unix domain socket at this path instead of TCP port "
+                        "(solution examples connect to it if HACKATHON_CONNECT_UNIX_SOCKET is set)", default=None)
+    parser.add_argument("--client", help="Evaluate solution client from this python file in server process, "
+                        "connected without sockets, e.g. solution/predict_online.py", default=None)
+    parser.add_argument("--instrument", "-i", help="Target instrument we calculation volatility for, "
+                        "comma separated list to evaluate several instruments at once", default="TEA")
     parser.add_argument("--no-progress", "-n", help="Disable progress bar in console", action="store_true")
     parser.add_argument("--log-dir", "-l", help="Path to directory to put logs", default=None)
+    parser.add_argument("--log-compression", help="Compression of session logs (convert them to text with session_log.py)",
+                        choices=session_log.get_compressions(), default=LOG_COMPRESSION)
+    parser.add_argument("--cache-dir", help="Directory for cached data (default: '<datafile>.cache')", default=None)
+    parser.add_argument("--no-cache", help="Do not use cached data", action="store_true")
+    parser.add_argument("--max-sessions", "-s", help="How many solutions are evaluated in parallel (progress bar is disabled if > 1)",
+                        type=int, default=MAX_SESSIONS)
+    parser.add_argument("--fork", help="Evaluate every solution in forked process (Unix only)", action="store_true")
+    parser.add_argument("--max-predict-batch", help="Max PREDICT_NOW sent before waiting for answers, "
+                        "if solution asks for batches (0: no batches, max: %d)" % hackathon_protocol.PREDICT_BATCH_SIZE_LIMIT,
+                        type=int, default=MAX_PREDICT_BATCH_SIZE)
+    parser.add_argument("--interim-score", help="Send interim score to solution every N answers (0: never)",
+                        type=int, default=INTERIM_SCORE_INTERVAL)
+    parser.add_argument("--response-timeout", "-t", help="Seconds to answer PREDICT_NOW, slower solution is stopped (0: no limit)",
+                        type=float, default=RESPONSE_TIMEOUT)
+    parser.add_argument("--asyncio", help="Evaluate all solutions in one asyncio event loop (progress bar is disabled)",
+                        action="store_true")
+    parser.add_argument("--stage-timing", help="Report time of every response stage: server, network, client "
+                        "(client stages if solution sets stage_timing, e.g. HACKATHON_STAGE_TIMING=1 for examples)",
+                        action="store_true")
+    parser.add_argument("--allow-no-checksum", help="Allow clients to disable message checksum (trusted localhost only)",
+                        action="store_true")
 
     args = parser.parse_args()
+    if args.asyncio and (args.unix_socket or args.client):
+        parser.error("--asyncio works only with TCP")
+    if args.max_predict_batch > hackathon_protocol.PREDICT_BATCH_SIZE_LIMIT:
+        parser.error("--max-predict-batch must not exceed %d (VOLATILITY_BATCH must fit into a message)"
+                     % hackathon_protocol.PREDICT_BATCH_SIZE_LIMIT)
 
     DATAFILE = args.datafile
     HOST = args.host
     PORT = args.port
-    TARGET_INSTRUMENT = args.instrument
-    ENABLE_PROGRESS_BAR = not args.no_progress
+    TARGET_INSTRUMENTS = tuple(args.instrument.split(','))
+    MAX_SESSIONS = max(1, args.max_sessions)
+    FORK_ON_CONNECT = args.fork
+    USE_ASYNCIO = args.asyncio
+    UNIX_SOCKET = args.unix_socket
+    IN_PROCESS_CLIENT = args.client
+    RESPONSE_TIMEOUT = args.response_timeout
+    INTERIM_SCORE_INTERVAL = args.interim_score
+    MAX_PREDICT_BATCH_SIZE = args.max_predict_batch
+    ENABLE_PROGRESS_BAR = not args.no_progress and MAX_SESSIONS == 1 and not USE_ASYNCIO
     OUTPUT_LOG_DIR = args.log_dir
+    LOG_COMPRESSION = args.log_compression
+    ALLOW_NO_CHECKSUM = args.allow_no_checksum
+    STAGE_TIMING = args.stage_timing
+    CACHE_DIR = '' if args.no_cache else args.cache_dir
 
     server = CheckSolutionServer()
     server.run()
@@ -0,0 +1,319 @@
+"""
+Orderbook features calculated online (orderbook by orderbook, O(1) per feature) and offline
+(vectorized over a dataframe) from the same definitions, so a model is trained on exactly
+the features it gets online.
+
+    features = FeaturePipeline([MidPrice(), Spread(), Microprice(), DepthImbalance(levels=5),
+                                OrderFlowImbalance(), RealizedVolatility((10, 100)), MidPriceStd((100,))])
+
+    # online, e.g. in Client.on_orderbook_row (pipeline keeps state of one instrument):
+    values = features.update(row)   # row is hackathon_protocol.OrderbookRow, values are preallocated
+                                    # (features.vector is numpy view of the same values)
+
+    # offline, rows of one instrument in time order:
+    matrix = features.transform(dataframe[dataframe['0_ID'] == 'TEA'])  # rows x len(features.names)
+
+Online and offline values are the same for prices in ticks (or half ticks) and integer volumes,
+otherwise rolling sums may differ by float rounding.
+"""
+from __future__ import division
+import math
+from array import array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None    # online features work without numpy, transform() needs it
+
+
+def price_column(side, level):
+    return '%s_P_%d' % (side, level)
+
+
+def volume_column(side, level):
+    return '%s_V_%d' % (side, level)
+
+
+def shifted(x, first):
+    # x[t - 1] for every t, first for t = 0
+    result = numpy.empty_like(x)
+    result[0:1] = first
+    result[1:] = x[:-1]
+    return result
+
+
+def rolling_sum(x, window):
+    # sum of last window values (fewer at the beginning), as RollingSum does online
+    cumulative = numpy.concatenate(([0.0], numpy.cumsum(x)))
+    begin = numpy.maximum(numpy.arange(1, len(x) + 1) - window, 0)
+    return cumulative[1:] - cumulative[begin]
+
+
+class RollingSum(object):
+    """
+    Sum of last window values (all values while there are fewer), update() costs O(1).
+    The sum is recalculated from the window once per window updates, so rounding errors do not accumulate.
+    """
+    def __init__(self, window):
+        assert window > 0
+        self.window = window
+        self.reset()
+
+    def reset(self):
+        self.values = [0.0] * self.window
+        self.count = 0
+        self.sum = 0.0
+
+    def update(self, x):
+        pos = self.count % self.window
+        self.sum += x - self.values[pos]
+        self.values[pos] = x
+        self.count += 1
+        if pos == self.window - 1:
+            self.sum = sum(self.values)
+        return self.sum
+
+
+class Feature(object):
+    """
+    Base class: names of values written by the feature, update() calculates them online
+    for next orderbook, transform() offline for all orderbooks at once.
+    """
+    names = ()
+
+    def bind(self, column_index):
+        # column_index(column_name) -> index in row values, called before first update()
+        pass
+
+    def reset(self):
+        # forget online state
+        pass
+
+    def update(self, values, out, offset):
+        # should be overridden
+        # values: orderbook prices and volumes, write len(names) results into out[offset:]
+        pass
+
+    def transform(self, column):
+        # should be overridden
+        # column(column_name) -> float64 array of all orderbooks, returns array (rows) or (rows x len(names))
+        pass
+
+
+class BestPricesFeature(Feature):
+    # feature of level 1 prices (and volumes)
+    def bind(self, column_index):
+        self.bid = column_index(price_column('BID', 1))
+        self.ask = column_index(price_column('ASK', 1))
+        self.bid_volume = column_index(volume_column('BID', 1))
+        self.ask_volume = column_index(volume_column('ASK', 1))
+
+
+class MidPrice(BestPricesFeature):
+    names = ('mid_price',)
+
+    def update(self, values, out, offset):
+        out[offset] = (values[self.bid] + values[self.ask]) / 2
+
+    def transform(self, column):
+        return (column(price_column('BID', 1)) + column(price_column('ASK', 1))) / 2
+
+
+class Spread(BestPricesFeature):
+    names = ('spread',)
+
+    def update(self, values, out, offset):
+        out[offset] = values[self.ask] - values[self.bid]
+
+    def transform(self, column):
+        return column(price_column('ASK', 1)) - column(price_column('BID', 1))
+
+
+class Microprice(BestPricesFeature):
+    # volume weighted mid price: closer to the side with less volume, mid price if there is no volume
+    names = ('microprice',)
+
+    def update(self, values, out, offset):
+        bid, ask = values[self.bid], values[self.ask]
+        bid_volume, ask_volume = values[self.bid_volume], values[self.ask_volume]
+        total = bid_volume + ask_volume
+        out[offset] = (bid * ask_volume + ask * bid_volume) / total if total > 0 else (bid + ask) / 2
+
+    def transform(self, column):
+        bid, ask = column(price_column('BID', 1)), column(price_column('ASK', 1))
+        bid_volume, ask_volume = column(volume_column('BID', 1)), column(volume_column('ASK', 1))
+        total = bid_volume + ask_volume
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            return numpy.where(total > 0, (bid * ask_volume + ask * bid_volume) / total, (bid + ask) / 2)
+
+
+class DepthImbalance(Feature):
+    # (bid volume - ask volume) / (bid volume + ask volume) of first levels, 0 if there is no volume
+    def __init__(self, levels=10):
+        self.levels = levels
+        self.names = ('depth_imbalance_%d' % levels,)
+
+    def bind(self, column_index):
+        self.bid_volumes = [column_index(volume_column('BID', level)) for level in range(1, self.levels + 1)]
+        self.ask_volumes = [column_index(volume_column('ASK', level)) for level in range(1, self.levels + 1)]
+
+    def update(self, values, out, offset):
+        bid_volume = ask_volume = 0.0
+        for n in self.bid_volumes: bid_volume += values[n]
+        for n in self.ask_volumes: ask_volume += values[n]
+        total = bid_volume + ask_volume
+        out[offset] = (bid_volume - ask_volume) / total if total > 0 else 0.0
+
+    def transform(self, column):
+        bid_volume = ask_volume = 0.0
+        for level in range(1, self.levels + 1):
+            bid_volume = bid_volume + column(volume_column('BID', level))
+            ask_volume = ask_volume + column(volume_column('ASK', level))
+        total = bid_volume + ask_volume
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            return numpy.where(total > 0, (bid_volume - ask_volume) / total, 0.0)
+
+
+class OrderFlowImbalance(BestPricesFeature):
+    """
+    Order flow imbalance of level 1 (Cont, Kukanov, Stoikov): volume added to bid minus volume added
+    to ask since previous orderbook, summed over last window orderbooks. 0 for the first orderbook.
+    """
+    def __init__(self, window=1):
+        self.window = window
+        self.names = ('ofi_%d' % window,)
+        self.reset()
+
+    def reset(self):
+        self.previous = None
+        self.sum = RollingSum(self.window)
+
+    def update(self, values, out, offset):
+        bid, ask = values[self.bid], values[self.ask]
+        bid_volume, ask_volume = values[self.bid_volume], values[self.ask_volume]
+        if self.previous is None:
+            flow = 0.0
+        else:
+            last_bid, last_ask, last_bid_volume, last_ask_volume = self.previous
+            flow = (bid_volume if bid >= last_bid else 0.0) - (last_bid_volume if bid <= last_bid else 0.0) \
+                 - (ask_volume if ask <= last_ask else 0.0) + (last_ask_volume if ask >= last_ask else 0.0)
+        self.previous = (bid, ask, bid_volume, ask_volume)
+        out[offset] = self.sum.update(flow)
+
+    def transform(self, column):
+        bid, ask = column(price_column('BID', 1)), column(price_column('ASK', 1))
+        bid_volume, ask_volume = column(volume_column('BID', 1)), column(volume_column('ASK', 1))
+        last_bid, last_ask = shifted(bid, numpy.nan), shifted(ask, numpy.nan)
+        last_bid_volume, last_ask_volume = shifted(bid_volume, 0.0), shifted(ask_volume, 0.0)
+        flow = numpy.where(bid >= last_bid, bid_volume, 0.0) - numpy.where(bid <= last_bid, last_bid_volume, 0.0) \
+             - numpy.where(ask <= last_ask, ask_volume, 0.0) + numpy.where(ask >= last_ask, last_ask_volume, 0.0)
+        return rolling_sum(flow, self.window)
+
+
+class RealizedVolatility(BestPricesFeature):
+    # sqrt of sum of squared mid price changes over last window orderbooks, for several windows
+    def __init__(self, windows=(100,)):
+        self.windows = tuple(windows)
+        self.names = tuple('realized_volatility_%d' % window for window in self.windows)
+        self.reset()
+
+    def reset(self):
+        self.last_mid_price = None
+        self.sums = [RollingSum(window) for window in self.windows]
+
+    def update(self, values, out, offset):
+        mid_price = (values[self.bid] + values[self.ask]) / 2
+        change = mid_price - self.last_mid_price if self.last_mid_price is not None else 0.0
+        self.last_mid_price = mid_price
+        for n, rolling in enumerate(self.sums):
+            out[offset + n] = math.sqrt(max(rolling.update(change * change), 0.0))
+
+    def transform(self, column):
+        mid_price = (column(price_column('BID', 1)) + column(price_column('ASK', 1))) / 2
+        change = mid_price - shifted(mid_price, mid_price[0] if len(mid_price) else 0.0)
+        return numpy.column_stack([numpy.sqrt(numpy.maximum(rolling_sum(change * change, window), 0.0))
+                                   for window in self.windows])
+
+
+class MidPriceStd(BestPricesFeature):
+    """
+    Standard deviation of mid prices of last window orderbooks (what is predicted, see calc_volatility
+    in solution examples), 0 until there are window orderbooks, for several windows.
+    Sums are of prices minus the first one, so they stay small.
+    """
+    def __init__(self, windows=(100,)):
+        assert min(windows) > 1
+        self.windows = tuple(windows)
+        self.names = tuple('mid_price_std_%d' % window for window in self.windows)
+        self.reset()
+
+    def reset(self):
+        self.first_mid_price = None
+        self.count = 0
+        self.sums = [(RollingSum(window), RollingSum(window)) for window in self.windows]
+
+    def update(self, values, out, offset):
+        mid_price = (values[self.bid] + values[self.ask]) / 2
+        if self.first_mid_price is None:
+            self.first_mid_price = mid_price
+        y = mid_price - self.first_mid_price
+        self.count += 1
+        for n, (window, (sum1, sum2)) in enumerate(zip(self.windows, self.sums)):
+            s1, s2 = sum1.update(y), sum2.update(y * y)
+            out[offset + n] = math.sqrt(max(s2 - s1 * s1 / window, 0.0) / (window - 1)) if self.count >= window else 0.0
+
+    def transform(self, column):
+        mid_price = (column(price_column('BID', 1)) + column(price_column('ASK', 1))) / 2
+        y = mid_price - (mid_price[0] if len(mid_price) else 0.0)
+        count = numpy.arange(1, len(y) + 1)
+        result = []
+        for window in self.windows:
+            s1, s2 = rolling_sum(y, window), rolling_sum(y * y, window)
+            std = numpy.sqrt(numpy.maximum(s2 - s1 * s1 / window, 0.0) / (window - 1))
+            result.append(numpy.where(count >= window, std, 0.0))
+        return numpy.column_stack(result)
+
+
+class FeaturePipeline(object):
+    """
+    Features written one after another into preallocated values (array of floats).
+    """
+    def __init__(self, features):
+        self.features = list(features)
+        self.names = tuple(name for feature in self.features for name in feature.names)
+        self.offsets = []
+        offset = 0
+        for feature in self.features:
+            self.offsets.append(offset)
+            offset += len(feature.names)
+
+        self.values = array('d', [0.0]) * len(self.names)
+        self.vector = numpy.frombuffer(self.values, dtype=numpy.float64) if numpy is not None else None
+        self.columns = None  # header the features are bound to
+
+    def reset(self):
+        for feature in self.features:
+            feature.reset()
+
+    def update(self, row):
+        # calculate all features for next orderbook of the instrument, returns values
+        if self.columns is not row.columns:
+            for feature in self.features:
+                feature.bind(row.column_index)
+            self.columns = row.columns
+
+        values, out = row.values, self.values
+        for feature, offset in zip(self.features, self.offsets):
+            feature.update(values, out, offset)
+        return out
+
+    def transform(self, data):
+        # data: DataFrame (or dict of columns) with orderbooks of one instrument in time order
+        def column(column_name):
+            return numpy.asarray(data[column_name], dtype=numpy.float64)
+
+        rows_count = len(column(price_column('BID', 1)))
+        result = numpy.empty((rows_count, len(self.names)))
+        for feature, offset in zip(self.features, self.offsets):
+            result[:, offset : offset + len(feature.names)] = numpy.asarray(feature.transform(column)).reshape(rows_count, -1)
+        return result
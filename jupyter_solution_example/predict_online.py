@@ -3,13 +3,40 @@
 from __future__ import print_function # for python 2 compatibility
 import hackathon_protocol
 import os
-import lightgbm as lgb
+import numpy as np
+from tree_ensemble import TreeEnsemble
+from orderbook_features import FeaturePipeline, MidPrice, Spread, Microprice, DepthImbalance, \
+    OrderFlowImbalance, RealizedVolatility, MidPriceStd
 
 USERNAME="the_Heartbreakers"
 PASSWORD="94ba670a"
 
 CONNECT_IP = os.environ.get("HACKATHON_CONNECT_IP") or "127.0.0.1"
 CONNECT_PORT = int(os.environ.get("HACKATHON_CONNECT_PORT") or 12345)
+CONNECT_UNIX_SOCKET = os.environ.get("HACKATHON_CONNECT_UNIX_SOCKET")  # server runs with --unix-socket on this machine
+STAGE_TIMING = bool(os.environ.get("HACKATHON_STAGE_TIMING"))  # send own stage times for server --stage-timing
+
+# > 1: server sends that many PREDICT_NOW before waiting for answers, model predicts them with one call
+# (a call costs more than evaluating trees for a row)
+PREDICT_BATCH_SIZE = int(os.environ.get("HACKATHON_PREDICT_BATCH") or 256)
+PRICE_FEATURES_COUNT = 4    # prices of first 2 levels, then features of make_feature_pipeline()
+
+
+def make_feature_pipeline():
+    # orderbook features of one instrument, the same for training (create_model.ipynb) and prediction
+    return FeaturePipeline([MidPrice(), Spread(), Microprice(), DepthImbalance(levels=5),
+                            OrderFlowImbalance(window=10), RealizedVolatility((10, 100)), MidPriceStd((10, 100))])
+
+
+def fill_features(features, row, pipeline_values):
+    # features of orderbook row as model was trained with (see create_model.ipynb),
+    # pipeline_values are used if model is trained with them
+    features[0] = int(row.best_ask)
+    features[1] = int(row.best_bid)
+    features[2] = int(row.ask_price(2))
+    features[3] = int(row.bid_price(2))
+    if len(features) > PRICE_FEATURES_COUNT:
+        features[PRICE_FEATURES_COUNT:] = pipeline_values
 
 
 class MyClient(hackathon_protocol.Client):
@@ -17,30 +44,52 @@ class MyClient(hackathon_protocol.Client):
         super(MyClient, self).__init__(sock)
         self.counter = 0
         self.target_instrument = 'TEA'
-        self.send_login(USERNAME, PASSWORD)
-        self.last_raw = None
+        self.stage_timing = STAGE_TIMING
+        self.send_login(USERNAME, PASSWORD, predict_batch_size=PREDICT_BATCH_SIZE)
+        self.last_row = None
+        self.last_pipeline_values = None
 
         # Load pre-trained model previously created by create_model.ipynb
-        self.model = lgb.Booster(model_file='my_model.txt')
+        # (evaluated without lightgbm, predictions are the same as lgb.Booster(model_file='my_model.txt').predict)
+        self.model = TreeEnsemble.load('my_model.txt')
+
+        # orderbook features are calculated only if model is trained with them
+        self.use_pipeline = self.model.features_count > PRICE_FEATURES_COUNT
+        self.pipelines = {}     # instrument -> FeaturePipeline
+
+        # features of rows to predict, preallocated: one row per PREDICT_NOW of a batch
+        self.features = np.zeros((max(PREDICT_BATCH_SIZE, 1), self.model.features_count))
 
     def on_header(self, csv_header):
         self.header = {column_name: n for n, column_name in enumerate(csv_header)}
         #print("Header:", self.header)
 
-    def on_orderbook(self, cvs_line_values):
+    def on_orderbook_row(self, row):
+        # row object is reused for every orderbook, features are taken from it when prediction is requested
+        self.last_row = row
+        if self.use_pipeline:
+            pipeline = self.pipelines.get(row.instrument)
+            if pipeline is None:
+                pipeline = self.pipelines[row.instrument] = make_feature_pipeline()
+            self.last_pipeline_values = pipeline.update(row)
+
+    def make_prediction(self, instrument=None):
+        assert self.last_row is not None
+        fill_features(self.features[0], self.last_row, self.last_pipeline_values)
+        answer = self.model.predict_row(self.features[0])
+        self.send_volatility(answer)
+        self.last_row = None
 
-        self.last_raw = [
-            int(cvs_line_values[self.header['ASK_P_1']]),
-            int(cvs_line_values[self.header['BID_P_1']]),
-            int(cvs_line_values[self.header['ASK_P_2']]),
-            int(cvs_line_values[self.header['BID_P_2']])]
+    def on_prediction_request(self, prediction_id, instrument):
+        # batch mode: features of this moment, predicted with the whole batch
+        assert self.last_row is not None
+        fill_features(self.features[len(self.prediction_ids)], self.last_row, self.last_pipeline_values)
+        super(MyClient, self).on_prediction_request(prediction_id, instrument)
+        self.last_row = None
 
-    def make_prediction(self):
-        assert self.last_raw is not None
-        prediction = self.model.predict([self.last_raw])
-        answer = prediction[0]
-        self.send_volatility(answer)
-        self.last_raw = None
+    def make_predictions(self, prediction_ids):
+        predictions = self.model.predict(self.features[:len(prediction_ids)])
+        self.send_volatility_batch(prediction_ids, predictions)
 
     def on_score(self, items_processed, time_elapsed, score_value):
         print("Completed! items processed: %d, time elapsed: %.3f sec, score: %.6f" % (items_processed, time_elapsed, score_value))
@@ -53,7 +102,10 @@ def on_connected(sock):
 
 
 def main():
-    hackathon_protocol.tcp_connect(CONNECT_IP, CONNECT_PORT, on_connected)
+    if CONNECT_UNIX_SOCKET:
+        hackathon_protocol.unix_connect(CONNECT_UNIX_SOCKET, on_connected)
+    else:
+        hackathon_protocol.tcp_connect(CONNECT_IP, CONNECT_PORT, on_connected)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,227 @@
+"""
+Evaluates LightGBM model saved as text (Booster.save_model, e.g. my_model.txt) without lightgbm:
+all trees are stored in a few flat numpy arrays and rows are evaluated vectorized over trees and rows.
+
+    model = TreeEnsemble.load('my_model.txt')
+    model.predict(features)     # same as lgb.Booster(model_file='my_model.txt').predict(features)
+    model.predict_row(values)   # single row, returns float
+
+Numerical splits with any missing value handling are supported, categorical splits and linear trees are not.
+"""
+from bisect import bisect_left
+import numpy as np
+
+PREDICT_BLOCK_ROWS = 4096   # rows evaluated at once by predict(), limits temporary arrays size
+MAX_TABLE_CELLS = 1 << 22   # max size of leaf tables (see TreeEnsemble), traversal is used for bigger models
+
+# decision_type bits, as in LightGBM tree.h
+DEFAULT_LEFT_MASK = 2
+MISSING_TYPE_SHIFT = 2
+MISSING_NONE, MISSING_ZERO, MISSING_NAN = 0, 1, 2
+ZERO_THRESHOLD = 1e-35
+
+IDENTITY_OBJECTIVES = ('regression', 'regression_l2', 'regression_l1', 'l1', 'l2', 'huber', 'fair', 'quantile', 'mape')
+
+
+def parse_model_text(text):
+    # returns (header dict, list of tree dicts), values are strings
+    header, trees = {}, []
+    current = header
+    for line in text.splitlines():
+        line = line.strip()
+        if line.startswith('Tree='):
+            current = {}
+            trees.append(current)
+        elif line == 'end of trees':
+            break
+        elif '=' in line:
+            key, value = line.split('=', 1)
+            current[key] = value
+    return header, trees
+
+
+class TreeEnsemble(object):
+    """
+    Nodes of all trees in flat arrays, leaves are nodes too: their children are the leaf itself,
+    so traversal of every (row, tree) stops in a leaf after max_depth steps.
+
+    Traversal is only used to build leaf tables, if they fit into MAX_TABLE_CELLS.
+    Split thresholds of a feature cut its axis into bins. Sorted thresholds of all trees give the
+    global bin of a value with one binary search. Every tree has a table with the leaf value for every
+    combination of its own bins, and bin_cells[feature][global_bin] holds the table position
+    contribution of that bin for all trees. So a row costs one binary search per feature and a sum
+    of a few rows, whatever the trees depth.
+    """
+    def __init__(self, header, trees):
+        objective = header.get('objective', 'regression').split(' ')[0]
+        if objective not in IDENTITY_OBJECTIVES:
+            raise ValueError("TreeEnsemble: objective '%s' is not supported" % objective)
+
+        self.features_count = int(header['max_feature_idx']) + 1
+        self.average_output = 'average_output' in header
+
+        features, thresholds, children, decision_types, leaf_values, roots, depths = [], [], [], [], [], [], []
+        for tree in trees:
+            if int(tree.get('num_cat', 0)) > 0:
+                raise ValueError("TreeEnsemble: categorical splits are not supported")
+            if int(tree.get('is_linear', 0)) != 0:
+                raise ValueError("TreeEnsemble: linear trees are not supported")
+
+            leaves = [float(v) for v in tree['leaf_value'].split()]
+            internal_count = len(leaves) - 1
+            first = len(leaf_values)
+            first_leaf = first + internal_count
+
+            def node_index(child):
+                # child >= 0: internal node, otherwise leaf ~child
+                return first + child if child >= 0 else first_leaf + ~child
+
+            if internal_count > 0:
+                left = [node_index(int(v)) for v in tree['left_child'].split()]
+                right = [node_index(int(v)) for v in tree['right_child'].split()]
+                features += [int(v) for v in tree['split_feature'].split()]
+                thresholds += [float(v) for v in tree['threshold'].split()]
+                decision_types += [int(v) for v in tree['decision_type'].split()]
+                children += list(zip(left, right))
+                leaf_values += [0.0] * internal_count
+
+            for n in range(len(leaves)):
+                features.append(0)
+                thresholds.append(np.inf)
+                decision_types.append(0)
+                children.append((first_leaf + n, first_leaf + n))
+            leaf_values += leaves   # saved leaf values already include shrinkage
+
+            roots.append(first)
+            depths.append(self.get_depth(children, first))
+
+        self.feature = np.array(features, dtype=np.intp)
+        self.threshold = np.array(thresholds, dtype=np.float64)
+        self.children = np.array(children, dtype=np.intp).reshape(-1)  # [2 * node + go_right]
+        self.leaf_value = np.array(leaf_values, dtype=np.float64)
+        self.roots = np.array(roots, dtype=np.intp)
+        self.max_depth = max(depths) if depths else 0
+
+        decision_types = np.array(decision_types, dtype=np.int64)
+        self.default_left = (decision_types & DEFAULT_LEFT_MASK) != 0
+        self.missing_type = (decision_types >> MISSING_TYPE_SHIFT) & 3
+        # without MISSING_ZERO and MISSING_NAN splits NaN is just 0.0, replaced before evaluation
+        self.handles_missing = bool(np.any(self.missing_type != MISSING_NONE))
+
+        self.bin_thresholds = None  # per feature: sorted thresholds of all trees (python list for bisect)
+        self.bin_cells = None       # per feature: (bins count, trees count) table position contributions
+        self.cell_values = None     # leaf values tables of all trees, one after another
+        if not self.handles_missing:
+            self.make_leaf_tables()
+
+    @staticmethod
+    def get_depth(children, root):
+        # depth of deepest leaf (0 for a tree with the only leaf)
+        depth, level = 0, [root]
+        while True:
+            level = [c for node in level for c in children[node] if c != node]
+            if not level: return depth
+            depth += 1
+
+    @classmethod
+    def load(cls, model_file):
+        with open(model_file) as f:
+            return cls(*parse_model_text(f.read()))
+
+    def make_leaf_tables(self):
+        internal = self.threshold != np.inf
+        node_tree = np.repeat(np.arange(len(self.roots)), np.diff(np.append(self.roots, len(self.threshold))))
+
+        # thresholds of every tree and feature, sorted, unique
+        tree_thresholds = [[np.unique(self.threshold[internal & (node_tree == t) & (self.feature == f)])
+                            for f in range(self.features_count)] for t in range(len(self.roots))]
+        tables_size = sum(int(np.prod([len(ts) + 1 for ts in per_feature])) for per_feature in tree_thresholds)
+        if tables_size > MAX_TABLE_CELLS:
+            return
+
+        global_thresholds = [np.unique(self.threshold[internal & (self.feature == f)]) for f in range(self.features_count)]
+        bin_cells = [np.zeros((len(g) + 1, len(self.roots)), dtype=np.intp) for g in global_thresholds]
+        cell_values = []
+        offset = 0
+        for t, per_feature in enumerate(tree_thresholds):
+            # value at every cell of the tree's grid: bin j of a feature is represented by its (j+1)-th
+            # threshold (value <= threshold is exactly what splits compare) or +inf for the last bin
+            axes = [np.append(ts, np.inf) for ts in per_feature]
+            grid = np.meshgrid(*axes, indexing='ij')
+            points = np.column_stack([g.reshape(-1) for g in grid])
+            cell_values.append(self.leaf_value[self.traverse(points, self.roots[t : t + 1])[:, 0]])
+
+            stride = len(points)
+            for f, ts in enumerate(per_feature):
+                stride //= len(ts) + 1
+                # tree's bin of every global bin: tree thresholds below the global bin
+                ranks = np.searchsorted(global_thresholds[f], ts)
+                local_bins = np.searchsorted(ranks, np.arange(len(global_thresholds[f]) + 1))
+                bin_cells[f][:, t] = local_bins * stride + (offset if f == 0 else 0)
+            offset += len(points)
+
+        self.bin_thresholds = [g.tolist() for g in global_thresholds]
+        self.bin_cells = bin_cells
+        self.cell_values = np.concatenate(cell_values)
+
+    def predict(self, features):
+        # features: 2d array-like (rows x features) or 1d for a single row, returns 1d array of predictions
+        x = np.asarray(features, dtype=np.float64)
+        if x.ndim == 1:
+            x = x.reshape(1, -1)
+        if x.shape[1] != self.features_count:
+            raise ValueError("TreeEnsemble: expected %d features, got %d" % (self.features_count, x.shape[1]))
+
+        result = np.empty(len(x))
+        for begin in range(0, len(x), PREDICT_BLOCK_ROWS):
+            result[begin : begin + PREDICT_BLOCK_ROWS] = self.predict_block(x[begin : begin + PREDICT_BLOCK_ROWS])
+        return result
+
+    def predict_row(self, values):
+        # single row (sequence of features values), returns float
+        if self.cell_values is None:
+            return float(self.predict(values)[0])
+
+        cells = None
+        for f, value in enumerate(values):
+            if value != value: value = 0.0    # NaN
+            row = self.bin_cells[f][bisect_left(self.bin_thresholds[f], value)]
+            cells = row if cells is None else cells + row
+        return self.output(self.cell_values[cells].sum())
+
+    def predict_block(self, x):
+        if not self.handles_missing and np.isnan(x).any():
+            x = np.where(np.isnan(x), 0.0, x)
+
+        if self.cell_values is not None:
+            cells = self.bin_cells[0][np.searchsorted(self.bin_thresholds[0], x[:, 0])]
+            for f in range(1, self.features_count):
+                cells += self.bin_cells[f][np.searchsorted(self.bin_thresholds[f], x[:, f])]
+            return self.output(self.cell_values[cells].sum(axis=1))
+
+        return self.output(self.leaf_value[self.traverse(x, self.roots)].sum(axis=1))
+
+    def output(self, raw):
+        return raw / len(self.roots) if self.average_output else raw
+
+    def traverse(self, x, roots):
+        # leaf node of every row (x rows) in every tree (roots), shape (rows, trees)
+        rows = np.arange(len(x))[:, None]
+        nodes = np.repeat(roots[None, :], len(x), axis=0)
+        for _ in range(self.max_depth):
+            values = x[rows, self.feature[nodes]]
+            go_right = ~(values <= self.threshold[nodes])
+            if self.handles_missing:
+                go_right = self.apply_missing(nodes, values, go_right)
+            nodes = self.children[2 * nodes + go_right]
+        return nodes
+
+    def apply_missing(self, nodes, values, go_right):
+        # decisions for missing values, as LightGBM NumericalDecision()
+        missing_type = self.missing_type[nodes]
+        is_nan = np.isnan(values)
+        values = np.where(is_nan & (missing_type != MISSING_NAN), 0.0, values)
+        go_right = np.where(is_nan & (missing_type != MISSING_NAN), ~(values <= self.threshold[nodes]), go_right)
+        use_default = ((missing_type == MISSING_ZERO) & (np.abs(values) <= ZERO_THRESHOLD)) | \
+                      ((missing_type == MISSING_NAN) & is_nan)
+        return np.where(use_default, ~self.default_left[nodes], go_right)
@@ -0,0 +1,255 @@
+#!/usr/bin/python
+"""
+Replays server messages to a solution client in this process, without sockets and without the server:
+messages are passed to client's on_message()/on_binary_message() one by one and its answers are collected.
+Reports CPU time of every client callback, messages per second and score (if correct answers are known).
+
+    python replay_session.py logs/20180101-120000-000_user.hlog.gz solution/predict_online.py
+    python replay_session.py data/training.csv.cache/v3_..._TEA_h100_w1000/messages_crc32_binary.bin solution/predict_online.py
+
+Messages are taken from:
+    - session log saved by check_solution_server.py --log-dir (binary, or text log of older versions:
+      text messages only), messages sent by server are replayed as they were, including LOGIN answers
+    - pre-framed stream: file with frames one after another, e.g. messages_*.bin prepared by the server
+      in its cache directory; correct answers are taken from answers.npy next to it
+Checksums are not checked. Client module is run from its directory (as if started there),
+its Client subclass is constructed with sock=None.
+"""
+from __future__ import print_function   # for python 2 compatibility
+import os, sys, re, runpy, time, math
+from itertools import islice
+
+sys.path.append('solution_example') # folder with hackathon_protocol.py
+import hackathon_protocol
+import session_log
+
+precise_time = getattr(time, 'perf_counter', time.time)
+cpu_time = getattr(time, 'process_time', None) or time.clock  # python 2: time.clock
+
+# callbacks of hackathon_protocol.Client timed by replay
+CALLBACKS = ('on_header', 'on_orderbook', 'on_orderbook_row', 'on_orderbook_array', 'make_prediction',
+             'on_prediction_request', 'make_predictions', 'on_interim_score', 'on_latency_stats', 'on_score')
+
+TEXT_LOG_LINE = re.compile(r'^\d{4}\.\d\d\.\d\d \d\d:\d\d:\d\d\.\d{3} \[SENT\] ')
+
+
+def read_log_frames(filename):
+    # frames sent by server, from binary or text session log
+    with session_log.open_log_input(filename) as f:
+        is_binary_log = f.read(len(session_log.MAGIC)) == session_log.MAGIC
+    if is_binary_log:
+        return [data for t, is_send, data in session_log.read_session_log(filename) if is_send]
+
+    frames = []
+    with open(filename, 'rb') as f:
+        for line in f:
+            line = hackathon_protocol.bytes_to_string(line).rstrip('\n')
+            match = TEXT_LOG_LINE.match(line)
+            if match:
+                frames.append(hackathon_protocol.string_to_bytes(line[match.end():]))
+    return frames
+
+
+def read_stream_frames(filename):
+    # frames one after another, as sent to socket
+    with open(filename, 'rb') as f:
+        view = memoryview(f.read())
+
+    frames = []
+    begin = 0
+    while begin + hackathon_protocol.PREFIX_LEN <= len(view):
+        body_len = int(view[begin : begin + hackathon_protocol.MBODYLEN_LEN].tobytes())
+        end = begin + hackathon_protocol.PREFIX_LEN + body_len
+        frames.append(view[begin:end])
+        begin = end
+    return frames
+
+
+def is_session_log(filename):
+    with open(filename, 'rb') as f:
+        start = f.read(max(len(session_log.MAGIC), len(b'2018.01.01')))
+    return start[:len(session_log.MAGIC)] == session_log.MAGIC or start[:2] == session_log.GZIP_MAGIC \
+        or start[:4] == session_log.ZSTD_MAGIC or re.match(br'^\d{4}\.\d\d\.\d\d', start) is not None
+
+
+def load_answers(path):
+    # correct answers from answers.npy (or directory with it), as saved in server's cache
+    import numpy as np
+    if os.path.isdir(path):
+        path = os.path.join(path, 'answers.npy')
+    return np.load(path)
+
+
+def load_client_class(filename, class_name=None):
+    # Client subclass defined in the file (the only one, if class_name is not set)
+    module_globals = runpy.run_path(filename, run_name='__replay__')
+    if class_name:
+        return module_globals[class_name]
+
+    classes = [value for value in module_globals.values() if isinstance(value, type)
+               and issubclass(value, hackathon_protocol.Client) and value.__module__ == '__replay__']
+    if len(classes) != 1:
+        raise ValueError("'%s' defines %d Client subclasses, choose one with --client-class" % (filename, len(classes)))
+    return classes[0]
+
+
+class CallbackTimer(object):
+    """
+    Wraps callbacks of client object, counts calls and CPU time of every callback.
+    Time of callbacks called by other callbacks is not included into caller's time.
+    """
+    def __init__(self, client, callback_names):
+        self.stats = {}         # callback name -> [calls, CPU seconds]
+        self.children = []      # CPU seconds of nested callbacks, for every callback being called
+        for name in callback_names:
+            if hasattr(client, name):
+                setattr(client, name, self.wrap(name, getattr(client, name)))
+
+    def wrap(self, name, callback):
+        stats = self.stats[name] = [0, 0.0]
+        children = self.children
+
+        def timed_callback(*args):
+            children.append(0.0)
+            start = cpu_time()
+            try:
+                return callback(*args)
+            finally:
+                elapsed = cpu_time() - start
+                nested = children.pop()
+                stats[0] += 1
+                stats[1] += elapsed - nested
+                if children:
+                    children[-1] += elapsed
+
+        return timed_callback
+
+
+class Replay(object):
+    def __init__(self, client, frames):
+        self.client = client
+        self.frames = frames
+        self.answers = []
+        self.messages_replayed = 0
+
+    def collect_answers(self):
+        # volatilities sent by client (other messages are ignored)
+        queue = self.client.send_queue
+        for raw_message in queue:
+            body = hackathon_protocol.bytes_to_string(bytes(raw_message[hackathon_protocol.PREFIX_LEN:]))
+            tokens = body.split('\t')
+            if tokens[0] == hackathon_protocol.VOLATILITY:
+                self.answers.append(float(tokens[1]))
+            elif tokens[0] == hackathon_protocol.VOLATILITY_BATCH:
+                self.answers.extend(float(token) for token in islice(tokens, 2, None))
+        self.client.messages_sent += len(queue)
+        del queue[:]
+
+    def run(self):
+        client, prefix_len = self.client, hackathon_protocol.PREFIX_LEN
+        binary_prefix = hackathon_protocol.BINARY_MESSAGE_PREFIX
+        self.collect_answers()  # LOGIN sent by constructor
+
+        for frame in self.frames:
+            body = memoryview(frame)[prefix_len:]
+            if body[:len(binary_prefix)] == binary_prefix:
+                client.on_binary_message(body)
+            else:
+                client.on_message(hackathon_protocol.bytes_to_string(body))
+            self.messages_replayed += 1
+
+            if client.send_queue:
+                self.collect_answers()
+            if client.stopped:
+                break
+
+
+def calc_score(answers, correct_answers):
+    # as CheckSolutionServer.Session.calc_score()
+    n = min(len(answers), len(correct_answers))
+    if n == 0 or abs(len(answers) - len(correct_answers)) >= 10:
+        return 0.0
+    import numpy as np
+    errors = np.asarray(answers[:n], dtype=np.float64) - np.asarray(correct_answers[:n], dtype=np.float64)
+    rmse = math.sqrt(np.dot(errors, errors) / n)
+    return 10.0 / rmse if rmse > 0 else 0.0
+
+
+def print_report(replay, timer, wall_time, total_cpu_time, correct_answers):
+    print("\nReplayed %d messages in %.3f sec: %.0f msgs/sec, CPU %.3f sec"
+          % (replay.messages_replayed, wall_time, replay.messages_replayed / max(wall_time, 1e-9), total_cpu_time))
+
+    print("%-24s %10s %12s %12s %7s" % ("callback", "calls", "CPU ms", "CPU us/call", "CPU %"))
+    callbacks_time = 0.0
+    for name, (calls, seconds) in sorted(timer.stats.items(), key=lambda item: -item[1][1]):
+        if calls == 0: continue
+        callbacks_time += seconds
+        print("%-24s %10d %12.1f %12.2f %6.1f%%" % (name, calls, 1000.0 * seconds, 1e6 * seconds / calls,
+                                                    100.0 * seconds / max(total_cpu_time, 1e-9)))
+    rest = max(total_cpu_time - callbacks_time, 0.0)
+    print("%-24s %10s %12.1f %12s %6.1f%%" % ("(protocol, replay)", "", 1000.0 * rest, "", 100.0 * rest / max(total_cpu_time, 1e-9)))
+
+    if correct_answers is not None:
+        print("Answers: %d (expected: %d), score: %.6f" % (len(replay.answers), len(correct_answers),
+                                                          calc_score(replay.answers, correct_answers)))
+    else:
+        print("Answers: %d, score is unknown (use --answers)" % len(replay.answers))
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Replay session log or framed stream to a solution client in-process")
+    parser.add_argument("messages", help="session log (.hlog, .hlog.gz, .hlog.zst, text .log) or file with framed messages")
+    parser.add_argument("client", help="python file with hackathon_protocol.Client subclass, e.g. solution/predict_online.py")
+    parser.add_argument("--client-class", help="Client subclass name, if the file defines several", default=None)
+    parser.add_argument("--answers", "-a", help="correct answers: answers.npy from server's cache directory (or the directory), "
+                        "default: answers.npy next to framed messages file", default=None)
+    parser.add_argument("--profile", help="Run client under cProfile, print N most expensive functions", type=int, default=0)
+    args = parser.parse_args()
+
+    messages_path = os.path.abspath(args.messages)
+    answers_path = os.path.abspath(args.answers) if args.answers else None
+
+    if is_session_log(messages_path):
+        frames = read_log_frames(messages_path)
+    else:
+        frames = read_stream_frames(messages_path)
+        default_answers = os.path.join(os.path.dirname(messages_path), 'answers.npy')
+        if answers_path is None and os.path.isfile(default_answers):
+            answers_path = default_answers
+    correct_answers = load_answers(answers_path) if answers_path else None
+    print("Loaded %d messages from '%s'" % (len(frames), args.messages))
+
+    client_path = os.path.abspath(args.client)
+    os.chdir(os.path.dirname(client_path))  # client may load model files from current directory
+    sys.path.insert(0, os.path.dirname(client_path))
+    client_class = load_client_class(client_path, args.client_class)
+
+    client = client_class(None)
+    timer = CallbackTimer(client, CALLBACKS)
+    replay = Replay(client, frames)
+
+    profiler = None
+    if args.profile:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+    start_wall_time, start_cpu_time = precise_time(), cpu_time()
+    replay.run()
+    wall_time, total_cpu_time = precise_time() - start_wall_time, cpu_time() - start_cpu_time
+
+    if profiler is not None:
+        profiler.disable()
+
+    print_report(replay, timer, wall_time, total_cpu_time, correct_answers)
+
+    if profiler is not None:
+        import pstats
+        print()
+        pstats.Stats(profiler).sort_stats('cumulative').print_stats(args.profile)
+
+
+if __name__ == '__main__':
+    main()
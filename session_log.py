@@ -0,0 +1,216 @@
+#!/usr/bin/python
+"""
+Binary session logs: every sent and received frame is a record, written to disk by a background
+thread while the session runs (see check_solution_server.py --log-dir).
+
+File: MAGIC, FILE_HEADER (wall clock time of session start), then records: RECORD_HEADER
+(record kind, seconds since session start by monotonic clock, data length), then data:
+raw frame for SENT and RECV records, utf-8 text for NOTE records (server messages).
+Whole file may be compressed with gzip or zstd (if zstandard module is installed).
+
+Convert log to the text format (as logs were saved before, binary orderbooks become text ORDERBOOK frames):
+    python session_log.py 20180101-120000-000_user.hlog.gz > session.log
+"""
+from __future__ import print_function   # for python 2 compatibility
+import sys, time, struct, threading, gzip, io
+
+sys.path.append('solution_example') # folder with hackathon_protocol.py
+import hackathon_protocol
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue   # python 2
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None    # zstd compression is not available
+
+MAGIC = b'HACKLOG1'
+FILE_HEADER = struct.Struct('<d')       # wall clock time of session start
+RECORD_HEADER = struct.Struct('<BdI')   # kind, seconds since start (monotonic clock), data length
+
+RECORD_NOTE, RECORD_SENT, RECORD_RECV = 0, 1, 2
+
+COMPRESSION_NONE = 'none'
+COMPRESSION_GZIP = 'gzip'
+COMPRESSION_ZSTD = 'zstd'
+COMPRESSION_EXTENSIONS = { COMPRESSION_NONE: '', COMPRESSION_GZIP: '.gz', COMPRESSION_ZSTD: '.zst' }
+
+GZIP_MAGIC = b'\x1f\x8b'
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+
+CHUNK_SIZE = 64 * 1024  # records are passed to writer thread in chunks of about that size
+MAX_QUEUED_CHUNKS = 64  # session waits for writer thread if disk is slower
+
+monotonic_time = getattr(time, 'monotonic', time.time)
+
+
+def get_compressions():
+    # compressions available in this python
+    return (COMPRESSION_NONE, COMPRESSION_GZIP) + ((COMPRESSION_ZSTD,) if zstandard is not None else ())
+
+
+def open_compressed_output(file, compression):
+    if compression == COMPRESSION_GZIP:
+        return gzip.GzipFile(fileobj=file, mode='wb', compresslevel=6)
+    if compression == COMPRESSION_ZSTD:
+        if zstandard is None:
+            raise ValueError("zstd compression needs zstandard module")
+        return zstandard.ZstdCompressor().stream_writer(file)
+    return file
+
+
+class SessionLogWriter(object):
+    """
+    write() packs a record into the current chunk, full chunks are written by a background thread,
+    so session does not keep the log in memory and does not wait for disk.
+    """
+    def __init__(self, filename, compression=COMPRESSION_NONE):
+        self.filename = filename
+        self.start_time = time.time()
+        self.start_monotonic_time = monotonic_time()
+        self.chunk = bytearray(MAGIC + FILE_HEADER.pack(self.start_time))
+        self.chunks = queue.Queue(MAX_QUEUED_CHUNKS)
+        self.error = None
+
+        self.file = open(filename, 'wb')
+        self.output = open_compressed_output(self.file, compression)
+        self.thread = threading.Thread(target=self.write_chunks, name='session log writer')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def write(self, is_send, data):
+        # is_send is True/False for sent/received frame (bytes or memoryview), None for text note
+        if is_send is None:
+            kind, data = RECORD_NOTE, data.encode('utf-8')
+        else:
+            kind = RECORD_SENT if is_send else RECORD_RECV
+        chunk = self.chunk
+        chunk += RECORD_HEADER.pack(kind, monotonic_time() - self.start_monotonic_time, len(data))
+        chunk += data
+        if len(chunk) >= CHUNK_SIZE:
+            self.flush()
+
+    def flush(self):
+        # pass current chunk to writer thread
+        if self.chunk:
+            self.chunks.put(self.chunk)
+            self.chunk = bytearray()
+
+    def close(self):
+        # write everything and close the file
+        self.flush()
+        self.chunks.put(None)
+        self.thread.join()
+        if self.error is not None:
+            print("Session log '%s' is incomplete:" % self.filename, self.error)
+
+    def write_chunks(self):
+        while True:
+            chunk = self.chunks.get()
+            if chunk is None: break
+            if self.error is None:  # after an error chunks are just taken, so session is not blocked
+                try:
+                    self.output.write(chunk)
+                except (IOError, OSError) as ex:
+                    self.error = ex
+        try:
+            if self.output is not self.file:
+                self.output.close()
+            self.file.close()
+        except (IOError, OSError) as ex:
+            self.error = self.error or ex
+
+
+def open_log_input(filename):
+    # file object with decompressed log, compression is detected by content
+    file = open(filename, 'rb')
+    magic = file.read(4)
+    file.seek(0)
+    if magic[:2] == GZIP_MAGIC:
+        file.close()
+        return gzip.open(filename, 'rb')
+    if magic == ZSTD_MAGIC:
+        if zstandard is None:
+            raise ValueError("'%s' is zstd compressed, zstandard module is needed" % filename)
+        return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(file))
+    return file
+
+
+def read_session_log(filename):
+    # yields (wall clock time, is_send, data): is_send is True/False for frames (bytes), None for notes (text)
+    with open_log_input(filename) as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError("'%s' is not a session log" % filename)
+        start_time, = FILE_HEADER.unpack(f.read(FILE_HEADER.size))
+
+        while True:
+            header = f.read(RECORD_HEADER.size)
+            if len(header) < RECORD_HEADER.size:
+                break   # end of file (or of incomplete log)
+            kind, t, data_len = RECORD_HEADER.unpack(header)
+            data = f.read(data_len)
+            if len(data) < data_len:
+                break
+
+            if kind == RECORD_NOTE:
+                yield start_time + t, None, data.decode('utf-8')
+            else:
+                yield start_time + t, kind == RECORD_SENT, data
+
+
+def binary_orderbook_as_text(frame):
+    # text ORDERBOOK frame with the same orderbook as BINARY_ORDERBOOK frame, with checksum of the same mode
+    prefix_len = hackathon_protocol.PREFIX_LEN
+    body = memoryview(frame)[prefix_len:]
+    instrument, time_str, values = hackathon_protocol.unpack_binary_orderbook(body)
+
+    checksum = hackathon_protocol.bytes_to_string(bytes(frame[prefix_len - 1 - hackathon_protocol.CHECKSUM_LEN : prefix_len - 1]))
+    checksum_mode = hackathon_protocol.CHECKSUM_NONE
+    for mode in (hackathon_protocol.CHECKSUM_MD5, hackathon_protocol.CHECKSUM_CRC32):
+        if hackathon_protocol.get_hex_checksum(body, mode) == checksum:
+            checksum_mode = mode
+
+    return hackathon_protocol.prepare_orderbook_raw_message((instrument, time_str) + values, checksum_mode)
+
+
+def write_text_log(records, output):
+    # records are (time, is_send, data) as read_session_log() yields, lines as check_solution_server.py logged before
+    second, second_str = None, None
+    for t, is_send, data in records:
+        if int(t) != second:
+            second = int(t)
+            second_str = time.strftime('%Y.%m.%d %H:%M:%S.', time.localtime(second))
+        output.write(second_str + "%03d" % (round(t * 1000) % 1000))
+
+        if is_send: output.write(" [SENT] ")
+        elif is_send is not None: output.write(" [RECV] ")
+        else: output.write("        ")
+
+        if is_send is not None and data[hackathon_protocol.PREFIX_LEN:].startswith(hackathon_protocol.BINARY_ORDERBOOK_PREFIX):
+            data = binary_orderbook_as_text(data)   # floats bytes are not text, may contain new lines
+        if not isinstance(data, str):
+            data = data.decode('utf-8', 'replace')
+        output.write(data)
+        output.write('\n')
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Convert binary session log to text")
+    parser.add_argument("logfile", help="session log (.hlog, .hlog.gz, .hlog.zst)")
+    parser.add_argument("--output", "-o", help="text log file (default: stdout)", default=None)
+    args = parser.parse_args()
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            write_text_log(read_session_log(args.logfile), output)
+    else:
+        write_text_log(read_session_log(args.logfile), sys.stdout)
+
+
+if __name__ == '__main__':
+    main()
@@ -2,6 +2,7 @@
 from __future__ import print_function # for python 2 compatibility
 import hackathon_protocol
 import math, os
+from array import array
 
 # todo: update password
 USERNAME="devman"
@@ -9,6 +10,14 @@ PASSWORD="devmanorg2017"
 
 CONNECT_IP = os.environ.get("HACKATHON_CONNECT_IP") or "127.0.0.1"
 CONNECT_PORT = int(os.environ.get("HACKATHON_CONNECT_PORT") or 12345)
+CONNECT_UNIX_SOCKET = os.environ.get("HACKATHON_CONNECT_UNIX_SOCKET")  # server runs with --unix-socket on this machine
+STAGE_TIMING = bool(os.environ.get("HACKATHON_STAGE_TIMING"))  # send own stage times for server --stage-timing
+
+VOLATILITY_WINDOW = 100
+CHECKSUM_MODE = hackathon_protocol.CHECKSUM_CRC32  # faster than default md5, used if server supports it
+ORDERBOOK_FORMAT = hackathon_protocol.ORDERBOOK_BINARY  # no text parsing, used if server supports it
+HISTORY_SIZE = VOLATILITY_WINDOW + 1  # how many last mid prices to keep: window and the value leaving it, increase if model needs more
+PREDICT_BATCH_SIZE = int(os.environ.get("HACKATHON_PREDICT_BATCH") or 0)  # > 1: answer PREDICT_NOW in batches
 
 
 def calc_volatility(mid_prices, window_size):
@@ -22,6 +31,129 @@ def calc_volatility(mid_prices, window_size):
     return math.sqrt(sum([(x - mean)**2 for x in window]) / (window_size - 1))
 
 
+class PriceHistory(object):
+    """
+    Fixed capacity history of last float values backed by array('d').
+    Every value is written twice (at i and i + capacity), so any window of last values
+    is contiguous and slicing returns a memoryview without copying (a copy in python 2):
+        history[-100:] -> memoryview with last 100 values (oldest first)
+    """
+    def __init__(self, capacity):
+        assert capacity > 0
+        self.capacity = capacity
+        self.data = array('d', [0.0]) * (2 * capacity)
+        try:
+            self.view = memoryview(self.data)
+        except TypeError:
+            self.view = self.data   # python 2: array has no buffer interface for memoryview
+        self.count = 0
+
+    def append(self, x):
+        pos = self.count % self.capacity
+        self.data[pos] = x
+        self.data[pos + self.capacity] = x
+        self.count += 1
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def __getitem__(self, index):
+        size = len(self)
+        end = (self.count - 1) % self.capacity + self.capacity + 1  # after the newest value
+        begin = end - size
+
+        if isinstance(index, slice):
+            start, stop, step = index.indices(size)
+            if step != 1:
+                raise ValueError("PriceHistory supports only contiguous slices")
+            stop = max(start, stop)
+            return self.view[begin + start : begin + stop]
+
+        if index < 0: index += size
+        if not 0 <= index < size:
+            raise IndexError("PriceHistory index out of range")
+        return self.data[begin + index]
+
+    def last(self, window_size):
+        return self[-window_size:]
+
+
+class RollingVolatility(object):
+    """
+    Streaming version of calc_volatility() for a fixed window of last PriceHistory values, update() costs O(1).
+    Keeps sum and sum of squares of values shifted by a reference price, so they stay small
+    and (for half-tick mid prices) exact. Reference price and sums are recalculated once per
+    window_size updates, which keeps floating point error from accumulating.
+    """
+    def __init__(self, history, window_size):
+        assert 1 < window_size < history.capacity   # value leaving the window is read from history
+        self.history = history
+        self.window_size = window_size
+        self.shift = None                   # reference value subtracted before summing
+        self.sum = 0.0
+        self.sum_sq = 0.0
+        self.value = 0
+
+    def update(self):
+        # called after a value is appended to history
+        history, n = self.history, self.window_size
+        x = history[-1]
+
+        if self.shift is None:
+            self.shift = x
+
+        y = x - self.shift
+        if history.count > n:
+            old = history[-n - 1] - self.shift
+            self.sum += y - old
+            self.sum_sq += y*y - old*old
+        else:
+            self.sum += y
+            self.sum_sq += y*y
+
+        if history.count < n:
+            return self.value
+
+        if history.count % n == 0:
+            # move reference to the current value and recalculate sums from scratch
+            window = history.last(n)
+            self.shift = x
+            self.sum = sum([v - x for v in window])
+            self.sum_sq = sum([(v - x)**2 for v in window])
+
+        m2 = self.sum_sq - self.sum * self.sum / n
+        self.value = math.sqrt(max(m2, 0.0) / (n - 1))
+        return self.value
+
+
+class MultiWindowVolatility(object):
+    """
+    Set of RollingVolatility for several window sizes of the same PriceHistory.
+    """
+    def __init__(self, history, window_sizes):
+        self.windows = { window_size: RollingVolatility(history, window_size) for window_size in window_sizes }
+
+    def update(self):
+        for w in self.windows.values():
+            w.update()
+
+    def get(self, window_size):
+        return self.windows[window_size].value
+
+
+class InstrumentState(object):
+    """
+    What the client keeps for every instrument it predicts volatility for.
+    """
+    def __init__(self):
+        self.mid_prices = PriceHistory(HISTORY_SIZE)
+        self.volatility = MultiWindowVolatility(self.mid_prices, (VOLATILITY_WINDOW,))
+
+    def update(self, mid_price):
+        self.mid_prices.append(mid_price)
+        self.volatility.update()
+
+
 def calc_volatility_new(row):
     
     return 0
@@ -30,10 +162,12 @@ def calc_volatility_new(row):
 class MyClient(hackathon_protocol.Client):
     def __init__(self, sock):
         super(MyClient, self).__init__(sock)
-        self.target_instrument = 'TEA'
+        self.target_instrument = 'TEA'   # predicted if server does not name instrument in PREDICT_NOW
+        self.stage_timing = STAGE_TIMING
 
-        self.send_login(USERNAME, PASSWORD)
-        self.mid_prices = []
+        self.send_login(USERNAME, PASSWORD, CHECKSUM_MODE, ORDERBOOK_FORMAT, PREDICT_BATCH_SIZE or None)
+        self.instruments = {}   # instrument -> InstrumentState
+        self.batch_answers = [] # batch mode: answers calculated at every PREDICT_NOW of current batch
         self.header = {}
 
     def is_log_enabled(self):
@@ -43,24 +177,35 @@ class MyClient(hackathon_protocol.Client):
         self.header = { column_name: n for n, column_name in enumerate(csv_header) }
         print("Header:", self.header)
 
-    def on_orderbook(self, cvs_line_values):
+    def on_orderbook_row(self, row):
 
         # TODO: update your model here
 
-        # read values using column names
-        instrument = cvs_line_values[self.header['0_ID']]
-        best_bid = int(cvs_line_values[self.header['BID_P_1']])
-        best_ask = int(cvs_line_values[self.header['ASK_P_1']])
-
-        if instrument == self.target_instrument:
-            self.mid_prices.append((best_bid + best_ask) / 2.0)
+        state = self.instruments.get(row.instrument)
+        if state is None:
+            state = self.instruments[row.instrument] = InstrumentState()
+        state.update((int(row.best_bid) + int(row.best_ask)) / 2.0)
 
-    def make_prediction(self):
-        # return current volatility as answer
-        answer = calc_volatility(self.mid_prices, 100)
+    def get_answer(self, instrument):
+        # current volatility
+        state = self.instruments.get(instrument or self.target_instrument)
+        return state.volatility.get(VOLATILITY_WINDOW) if state is not None else 0
 
+    def make_prediction(self, instrument=None):
         # TODO: provide better prediction algorithm here
-        self.send_volatility(answer)
+        self.send_volatility(self.get_answer(instrument))
+
+    def on_prediction_request(self, prediction_id, instrument):
+        # batch mode: answer is known right now, it's sent with the whole batch
+        super(MyClient, self).on_prediction_request(prediction_id, instrument)
+        self.batch_answers.append(self.get_answer(instrument))
+
+    def make_predictions(self, prediction_ids):
+        answers, self.batch_answers = self.batch_answers, []
+        self.send_volatility_batch(prediction_ids, answers)
+
+    def on_latency_stats(self, p50, p90, p99, max_latency):
+        print("Response latency p50: %.3f ms, p90: %.3f ms, p99: %.3f ms, max: %.3f ms" % (1000*p50, 1000*p90, 1000*p99, 1000*max_latency))
 
     def on_score(self, items_processed, time_elapsed, score_value):
         print("Completed! items processed: %d, time elapsed: %.3f sec, score: %.6f" % (items_processed, time_elapsed, score_value))
@@ -73,4 +218,7 @@ def on_connected(sock):
 
 
 if __name__ == '__main__':
-    hackathon_protocol.tcp_connect(CONNECT_IP, CONNECT_PORT, on_connected)
+    if CONNECT_UNIX_SOCKET:
+        hackathon_protocol.unix_connect(CONNECT_UNIX_SOCKET, on_connected)
+    else:
+        hackathon_protocol.tcp_connect(CONNECT_IP, CONNECT_PORT, on_connected)
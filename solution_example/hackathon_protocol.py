@@ -1,5 +1,12 @@
 from __future__ import print_function # for python 2 compatibility
-import hashlib, socket, time, sys
+import hashlib, socket, time, sys, zlib, struct, os, threading, collections
+from itertools import islice, repeat
+from array import array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None    # binary orderbooks are passed as tuples then
 
 MBODYLEN_LEN = 4
 CHECKSUM_LEN = 8
@@ -10,19 +17,81 @@ ORDERBOOK = 'ORDERBOOK'
 PREDICT_NOW = 'PREDICT_NOW'
 VOLATILITY = 'VOLATILITY'
 SCORE = 'SCORE'
+INTERIM_SCORE = 'INTERIM_SCORE'   # score of answers received so far, sent periodically during the session
+CHECKSUM = 'CHECKSUM'   # server's answer to checksum mode requested in LOGIN
+ORDERBOOK_FORMAT = 'ORDERBOOK_FORMAT'   # server's answer to orderbook format requested in LOGIN
+BINARY_ORDERBOOK = 'BINARY_ORDERBOOK'
+PREDICT_BATCH_SIZE = 'PREDICT_BATCH_SIZE' # server's answer to predict batch size requested in LOGIN
+PREDICT_BATCH = 'PREDICT_BATCH'   # batch mode: answer all PREDICT_NOW received since previous batch
+VOLATILITY_BATCH = 'VOLATILITY_BATCH'   # batch mode: first prediction id, then volatility for every id of the batch
+STAGE_TIMES = 'STAGE_TIMES' # sent by client after an answer if stage_timing is set: seconds from receiving
+                            # the last data to make_prediction call, seconds in make_prediction
+
+# LOGIN options, sent as "name=value" after pass_hash
+LOGIN_OPTION_CHECKSUM = 'checksum'
+LOGIN_OPTION_ORDERBOOK = 'orderbook'
+LOGIN_OPTION_PREDICT_BATCH = 'batch'
+
+# checksum modes, md5 is default (and the only mode known by old clients and servers)
+CHECKSUM_MD5 = 'md5'
+CHECKSUM_CRC32 = 'crc32'
+CHECKSUM_NONE = 'none'  # checksum is not calculated and not checked, for trusted localhost only
+
+# orderbook formats, text is default
+ORDERBOOK_TEXT = 'text'
+ORDERBOOK_BINARY = 'binary'
+
+# binary message body: name, tab, then struct-packed data
+BINARY_MESSAGE_PREFIX = b'BINARY_'
+BINARY_ORDERBOOK_PREFIX = b'BINARY_ORDERBOOK\t'
+# instrument and time (ascii, zero padded), followed by little-endian float64 prices and volumes in header order
+BINARY_ORDERBOOK_INSTRUMENT_LEN = 8
+BINARY_ORDERBOOK_TIME_LEN = 32
+BINARY_ORDERBOOK_HEADER = struct.Struct('<%ds%ds' % (BINARY_ORDERBOOK_INSTRUMENT_LEN, BINARY_ORDERBOOK_TIME_LEN))
 
 MESSAGE_FORMAT = "%%0%dd\t%%s\t%%s" % MBODYLEN_LEN
 
 MAX_MESSAGE_LEN = 10000
+# VOLATILITY_BATCH of so many answers fits into MAX_MESSAGE_LEN: name, id (up to 20 digits),
+# tab and float (up to 24 characters) for every answer
+MAX_FLOAT_LEN = 24
+PREDICT_BATCH_SIZE_LIMIT = (MAX_MESSAGE_LEN - len(VOLATILITY_BATCH) - 1 - 20) // (1 + MAX_FLOAT_LEN)
+PREFIX_LEN = MBODYLEN_LEN + 1 + CHECKSUM_LEN + 1  # body_len + tab + checksum + tab
+
+RECV_BUFFER_SIZE = 1024*1024  # should be much bigger than PREFIX_LEN + MAX_MESSAGE_LEN
+SEND_MAX_BUFFERS = 1024       # max frames passed to one sendmsg() call (IOV_MAX on Linux)
+SEND_USE_SENDMSG = hasattr(socket.socket, 'sendmsg')  # not available in python2 and on Windows
+FRAME_BLOCK_ROWS = 4096       # rows formatted at once by frame_blocks(), limits temporary arrays
+
+precise_time = getattr(time, 'perf_counter', time.time)
+
+
+def md5_hex_checksum(value):
+    return hashlib.md5(value).hexdigest()[:CHECKSUM_LEN]
+
+
+def crc32_hex_checksum(value):
+    return '%08x' % (zlib.crc32(value) & 0xffffffff)
 
 
-def get_hex_checksum(value):
+def no_hex_checksum(value):
+    return '0' * CHECKSUM_LEN
 
-    if isinstance(value, (bytes, bytearray)):  # In python2: string and bytes types are same, this condition is True
-        return hashlib.md5(value).hexdigest()[:CHECKSUM_LEN]
+
+CHECKSUM_FUNCTIONS = {
+    CHECKSUM_MD5: md5_hex_checksum,
+    CHECKSUM_CRC32: crc32_hex_checksum,
+    CHECKSUM_NONE: no_hex_checksum,
+}
+
+
+def get_hex_checksum(value, checksum_mode=CHECKSUM_MD5):
+
+    if isinstance(value, (bytes, bytearray, memoryview)):  # In python2: string and bytes types are same, this condition is True
+        return CHECKSUM_FUNCTIONS[checksum_mode](value)
 
     if isinstance(value, str):
-        return get_hex_checksum(string_to_bytes(value))
+        return get_hex_checksum(string_to_bytes(value), checksum_mode)
 
     raise TypeError("Invalid type for get_hex_checksum()")
 
@@ -32,7 +101,7 @@ def py3_string_to_bytes(string_value):
 
 
 def py3_bytes_to_string(bytes_value):
-    return bytes_value.decode("utf-8")
+    return str(bytes_value, "utf-8")  # works for bytes, bytearray and memoryview
 
 
 def py2_string_to_bytes(value):
@@ -40,6 +109,8 @@ def py2_string_to_bytes(value):
 
 
 def py2_bytes_to_string(value):
+    if isinstance(value, memoryview):
+        return value.tobytes()
     return str(value)
 
 
@@ -53,103 +124,245 @@ else:
     DisconnectError = socket.error
 
 
-def make_raw_message(message_body):
+def make_raw_message(message_body, checksum_mode=CHECKSUM_MD5):
 
     if isinstance(message_body, (tuple, list)):
         # tuple support
-        return make_raw_message('\t'.join((str(x) for x in message_body)))
-
-    return string_to_bytes(MESSAGE_FORMAT % (len(message_body), get_hex_checksum(message_body), message_body))
+        return make_raw_message('\t'.join((str(x) for x in message_body)), checksum_mode)
+
+    return string_to_bytes(MESSAGE_FORMAT % (len(message_body), get_hex_checksum(message_body, checksum_mode), message_body))
+
+
+def make_raw_binary_message(message_body, checksum_mode=CHECKSUM_MD5):
+    # message_body is bytes
+    prefix = MESSAGE_FORMAT % (len(message_body), get_hex_checksum(message_body, checksum_mode), '')
+    return string_to_bytes(prefix) + message_body
+
+
+def format_column(column):
+    # str() of every value: utf-8 numpy bytes array (list of str without numpy),
+    # numeric columns are converted through their unique values
+    if numpy is None:
+        if hasattr(column, 'tolist'):
+            column = column.tolist()
+        return [str(x) for x in column]
+
+    column = numpy.asarray(column)
+    kind = column.dtype.kind
+    if kind in 'iu' and len(column) and int(column.max()) - int(column.min()) < len(column):
+        # narrow range (prices, volumes): table of strings for every value in range, nothing is sorted
+        low = int(column.min())
+        return numpy.array([string_to_bytes(str(x)) for x in range(low, int(column.max()) + 1)])[column - low]
+    if kind in 'iuf':
+        uniques, codes = numpy.unique(column, return_inverse=True)
+        return numpy.array([string_to_bytes(str(x)) for x in uniques.tolist()])[codes.ravel()]
+    if kind == 'S':
+        return column
+    if kind == 'U':
+        return numpy.char.encode(column, 'utf-8')
+    return numpy.array([string_to_bytes(str(x)) for x in column.tolist()])
+
+
+def frame_blocks(columns, message_name=ORDERBOOK, checksum_mode=CHECKSUM_MD5):
+    """
+    Frames many messages by FRAME_BLOCK_ROWS rows, message n is the same as
+        make_raw_message((message_name, columns[0][n], columns[1][n], ...), checksum_mode)
+    columns are lists or numpy arrays / pandas series of equal length. Yields (frames, lengths) for
+    every block: list of frames (bytes) and their lengths (numpy array). Bodies, their lengths and
+    frame prefixes are made by numpy string operations for the whole block; checksums are still
+    calculated body by body (hashlib and zlib have no batch interface).
+    """
+    get_checksum = CHECKSUM_FUNCTIONS[checksum_mode]
+    columns = [column.to_numpy() if hasattr(column, 'to_numpy') else column for column in columns]
+    rows_count = len(columns[0]) if columns else 0
+
+    for begin in range(0, rows_count, FRAME_BLOCK_ROWS):
+        block = [format_column(column[begin : begin + FRAME_BLOCK_ROWS]) for column in columns]
+
+        if numpy is None:
+            frames = []
+            for items in zip(repeat(message_name), *block):
+                body = string_to_bytes('\t'.join(items))
+                frames.append(string_to_bytes(MESSAGE_FORMAT % (len(body), get_checksum(body), '')) + body)
+            yield frames, [len(frame) for frame in frames]
+            continue
+
+        # fields with tabs are added pairwise, so long bodies are not copied for every column
+        parts = [numpy.char.add(string_to_bytes(message_name + '\t'), block[0])] \
+                + [numpy.char.add(b'\t', column) for column in block[1:]]
+        while len(parts) > 1:
+            parts = [numpy.char.add(*parts[n : n + 2]) if n + 1 < len(parts) else parts[n] for n in range(0, len(parts), 2)]
+        bodies = parts[0]
+        lengths = numpy.char.str_len(bodies)
+
+        checksums = numpy.array([string_to_bytes(get_checksum(body)) for body in bodies.tolist()])
+        prefixes = numpy.char.add(numpy.char.zfill(lengths.astype('S'), MBODYLEN_LEN), b'\t')
+        frames = numpy.char.add(numpy.char.add(numpy.char.add(prefixes, checksums), b'\t'), bodies)
+        yield frames.tolist(), lengths + PREFIX_LEN
+
+
+def frame_many(columns, message_name=ORDERBOOK, checksum_mode=CHECKSUM_MD5):
+    # frames of frame_blocks() as (buffer, offsets): bytearray with all messages,
+    # n-th message is buffer[offsets[n]:offsets[n + 1]]
+    buffer = bytearray()
+    offsets = array('q', [0])
+    for frames, lengths in frame_blocks(columns, message_name, checksum_mode):
+        buffer += b''.join(frames)
+        if numpy is not None:
+            offsets.extend((numpy.cumsum(lengths) + offsets[-1]).tolist())
+        else:
+            for length in lengths:
+                offsets.append(offsets[-1] + length)
+    return buffer, offsets
 
 
 class SessionImpl(object):
+    # sock is a connected socket: TCP, Unix socket (unix_listen, unix_connect, socket.socketpair)
+    # or MemoryTransport (sessions in one process, see memory_transport_pair)
     def __init__(self, sock, run_result = None):
         self.sock = sock
-        self.recv_buffer = bytearray()
-        self.send_buffer = bytearray()
+        # received bytes are in recv_buffer[recv_begin:recv_end], buffer is preallocated and never resized
+        self.recv_buffer = bytearray(RECV_BUFFER_SIZE)
+        self.recv_view = memoryview(self.recv_buffer)
+        self.recv_begin = 0
+        self.recv_end = 0
+        self.send_queue = []    # frames waiting to be sent, flushed by flush_send_queue()
+        self.messages_sent = 0
+        self.send_syscalls = 0
         self.run_result = run_result
         self.stopped = False
+        self.send_checksum_mode = CHECKSUM_MD5
+        self.recv_checksum_mode = CHECKSUM_MD5
         self.bytes_recv = 0
         self.start_time = time.time()
-        self.sock.settimeout(1.0)
+        self.recv_paused = False    # stop processing received messages (see hackathon_protocol_async)
+        self.recv_time = None       # precise_time() of last received data
+        if sock is not None:
+            self.sock.settimeout(1.0)
 
     def is_log_enabled(self): return False
 
     def send_message(self, message_body):
-        return self.send_raw_message(make_raw_message(message_body))
+        return self.send_raw_message(make_raw_message(message_body, self.send_checksum_mode))
 
     def send_raw_message(self, message_bytes):
         self.log(True, message_bytes)
-        self.send_buffer += message_bytes
+        self.send_queue.append(message_bytes)
         return self
 
-    def run(self):
-        prefix_len = MBODYLEN_LEN + 1 + CHECKSUM_LEN + 1 # body_len + tab + checksum + tab
+    def flush_send_queue(self):
+        # send all queued frames, several frames per syscall; handles partial writes
+        queue = self.send_queue
+        first = 0   # first not sent (or partially sent) frame
+
+        while first < len(queue):
+            batch = queue[first : first + SEND_MAX_BUFFERS]
+            if SEND_USE_SENDMSG:
+                sent = self.sock.sendmsg(batch)
+            else:
+                sent = self.sock.send(b''.join(batch))
+            self.send_syscalls += 1
+
+            # skip completely sent frames, keep unsent tail of partially sent one
+            while sent > 0:
+                frame_len = len(queue[first])
+                if sent < frame_len:
+                    queue[first] = memoryview(queue[first])[sent:]
+                    break
+                sent -= frame_len
+                first += 1
+
+        self.messages_sent += first
+        del queue[:]
+
+    def get_send_syscalls_per_message(self):
+        return self.send_syscalls / float(max(self.messages_sent, 1))
 
+    def run(self):
         try:
             while True:
-                while len(self.send_buffer) > 0:
-                    CHUNK_SIZE = 2*1024
-                    self.sock.send(self.send_buffer[:CHUNK_SIZE])
-                    del self.send_buffer[:CHUNK_SIZE]
+                self.flush_send_queue()
 
                 if self.stopped: break;
 
                 try:
-                    # wait until any amount of bytes received
-                    just_recv = self.sock.recv(1024*1024)
+                    if not self.recv_and_process(): break
                 except socket.timeout:
                     # timeout
                     self.on_socket_timeout()
-                    continue
 
-                if not just_recv: break
+        except (DisconnectError, ValueError) as ex:
+            print("Disconnected, because", ex)
 
-                self.recv_buffer += just_recv
-                self.bytes_recv += len(just_recv)
+        print("TCP Session finished")
+        self.sock.close()
+        return self.run_result
 
-                #self.log(None, b"Now received %d, total received %d" % (len(just_recv), self.bytes_recv))
+    def recv_and_process(self):
+        # wait until any amount of bytes received, write them right after already received ones and process them,
+        # returns False if connection is closed
+        just_recv = self.sock.recv_into(self.recv_view[self.recv_end:])
+        if not just_recv: return False
+        self.recv_time = precise_time()
 
-                # try read messages from buffer
-                while True:
-                    if len(self.recv_buffer) < prefix_len:
-                        break
+        self.recv_end += just_recv
+        self.bytes_recv += just_recv
 
-                    body_len = int(self.recv_buffer[:MBODYLEN_LEN])
+        #self.log(None, b"Now received %d, total received %d" % (just_recv, self.bytes_recv))
 
-                    if body_len < 0:
-                        raise ValueError("Invalid message len (%d)" % body_len)
+        self.process_recv_buffer()
+        return True
 
-                    if body_len > MAX_MESSAGE_LEN:
-                        raise ValueError("Too big incoming message len (%d)" % body_len)
+    def process_recv_buffer(self):
+        # read all complete messages from buffer, messages are not copied (memoryview slices)
+        buffer, view = self.recv_buffer, self.recv_view
+        begin, end = self.recv_begin, self.recv_end
+        log, on_message = self.log, self.on_message
 
-                    msg_len = prefix_len + body_len
+        while end - begin >= PREFIX_LEN and not self.recv_paused:
+            body_len = int(buffer[begin : begin + MBODYLEN_LEN])
 
-                    if len(self.recv_buffer) < msg_len:
-                        break
+            if body_len < 0:
+                raise ValueError("Invalid message len (%d)" % body_len)
 
-                    raw_message = self.recv_buffer[:msg_len]
-                    self.log(False, raw_message)
-                    checksum = raw_message[MBODYLEN_LEN + 1 : MBODYLEN_LEN + 1 + CHECKSUM_LEN]
-                    body = raw_message[prefix_len:]
-                    if bytes_to_string(checksum) != get_hex_checksum(body):
-                        raise ValueError("Checksum error. body: " + bytes_to_string(body[:10000]))
+            if body_len > MAX_MESSAGE_LEN:
+                raise ValueError("Too big incoming message len (%d)" % body_len)
 
-                    self.on_message(bytes_to_string(body))
-                    del self.recv_buffer[:msg_len]
+            body_begin = begin + PREFIX_LEN
+            msg_end = body_begin + body_len
 
-        except (DisconnectError, ValueError) as ex:
-            print("Disconnected, because", ex)
+            if end < msg_end:
+                break
 
-        print("TCP Session finished")
-        self.sock.close()
-        return self.run_result
+            log(False, view[begin:msg_end])
+            body = view[body_begin:msg_end]
+            if self.recv_checksum_mode != CHECKSUM_NONE:
+                checksum = bytes_to_string(buffer[body_begin - CHECKSUM_LEN - 1 : body_begin - 1])
+                if checksum != get_hex_checksum(body, self.recv_checksum_mode):
+                    raise ValueError("Checksum error. body: " + repr(body[:10000].tobytes()))
+
+            begin = self.recv_begin = msg_end
+            if body[:len(BINARY_MESSAGE_PREFIX)] == BINARY_MESSAGE_PREFIX:
+                self.on_binary_message(body)
+            else:
+                on_message(bytes_to_string(body))
+
+        if begin == end:
+            # everything is processed, start from the beginning of buffer
+            begin = end = 0
+        elif len(buffer) - end < PREFIX_LEN + MAX_MESSAGE_LEN:
+            # not enough space for the rest of incomplete message: move it to the beginning
+            buffer[:end - begin] = buffer[begin:end]
+            begin, end = 0, end - begin
+
+        self.recv_begin, self.recv_end = begin, end
 
     def log(self, is_send, raw_message):
         # may be overloaded as well
+        # note: received raw_message is a memoryview into receive buffer, copy it (bytes(raw_message)) to keep
         if self.is_log_enabled():
             send_or_recv = "[SEND]" if is_send else ("[RECV]" if is_send is not None else " "*6)
-            print('%.6f' % (time.time() - self.start_time), send_or_recv, bytes_to_string(raw_message))
+            print('%.6f' % (time.time() - self.start_time), send_or_recv, raw_message_as_text(raw_message))
         return
 
     def stop(self):
@@ -158,16 +371,113 @@ class SessionImpl(object):
     def on_message(self, message_body):
         pass
 
+    def on_binary_message(self, message_body):
+        # message_body is a memoryview into receive buffer, valid only during the call
+        pass
+
+    def handle_callback_result(self, result):
+        # result of user callback (make_prediction), may be awaitable in hackathon_protocol_async
+        pass
+
     def on_socket_timeout(self):
         pass
 
 
+def is_overridden(obj, base_class, method_name):
+    method = getattr(type(obj), method_name)
+    base_method = getattr(base_class, method_name)
+    return getattr(method, '__func__', method) is not getattr(base_method, '__func__', base_method)
+
+
+class OrderbookRow(object):
+    """
+    Orderbook record reused for every ORDERBOOK message (see Client.on_orderbook_row).
+    Column indices are found once from HEADER, so accessors do not look up column names.
+    values are prices and volumes in header order (columns after instrument and time).
+    """
+    __slots__ = ('columns', 'instrument', 'time', 'values',
+                 'bid_price_indices', 'bid_volume_indices', 'ask_price_indices', 'ask_volume_indices')
+
+    VALUES_OFFSET = 2  # instrument, time
+
+    def __init__(self, csv_header):
+        # instrument and time are not in values, column_index() raises KeyError for them
+        self.columns = { column_name: n for n, column_name in enumerate(csv_header[self.VALUES_OFFSET:]) }
+        self.instrument = None
+        self.time = None
+        self.values = [0.0] * (len(csv_header) - self.VALUES_OFFSET)
+
+        def indices(name_format):
+            # indices for levels 1, 2, ... while column is present in header
+            result = []
+            while (name_format % (len(result) + 1)) in self.columns:
+                result.append(self.columns[name_format % (len(result) + 1)])
+            return tuple(result)
+
+        self.bid_price_indices = indices('BID_P_%d')
+        self.bid_volume_indices = indices('BID_V_%d')
+        self.ask_price_indices = indices('ASK_P_%d')
+        self.ask_volume_indices = indices('ASK_V_%d')
+
+    def column_index(self, column_name):
+        # index in values for column name from header
+        return self.columns[column_name]
+
+    @property
+    def best_bid(self):
+        return self.values[self.bid_price_indices[0]]
+
+    @property
+    def best_ask(self):
+        return self.values[self.ask_price_indices[0]]
+
+    @property
+    def best_bid_volume(self):
+        return self.values[self.bid_volume_indices[0]]
+
+    @property
+    def best_ask_volume(self):
+        return self.values[self.ask_volume_indices[0]]
+
+    def bid_price(self, level):
+        # level is 1-based, as in column names
+        return self.values[self.bid_price_indices[level - 1]]
+
+    def bid_volume(self, level):
+        return self.values[self.bid_volume_indices[level - 1]]
+
+    def ask_price(self, level):
+        return self.values[self.ask_price_indices[level - 1]]
+
+    def ask_volume(self, level):
+        return self.values[self.ask_volume_indices[level - 1]]
+
+
 class Client(SessionImpl):
     def __init__(self, sock):
         super(Client, self).__init__(sock)
-
-    def send_login(self, username, pass_hash):
-        return self.send_message((LOGIN, username, pass_hash))
+        self.orderbook_format = ORDERBOOK_TEXT
+        self.binary_instruments = {}    # packed instrument -> instrument string
+        self.orderbook_row = None       # OrderbookRow, made on HEADER
+        self.use_orderbook_rows = is_overridden(self, Client, 'on_orderbook_row')
+        self.predict_batch_size = 0     # set by server's PREDICT_BATCH_SIZE, 0: one PREDICT_NOW at a time
+        self.prediction_ids = []        # batch mode: ids of PREDICT_NOW received since previous PREDICT_BATCH
+        self.stage_timing = False       # send STAGE_TIMES after every answer, server reports where response time goes
+
+    def send_login(self, username, pass_hash, checksum_mode=None, orderbook_format=None, predict_batch_size=None):
+        # checksum_mode (CHECKSUM_CRC32 or CHECKSUM_NONE) is used only if server confirms it with CHECKSUM message,
+        # client must not send anything else until that (messages are checked by server in new mode right after LOGIN)
+        # orderbook_format ORDERBOOK_BINARY makes server send BINARY_ORDERBOOK (see on_orderbook_array) if supported
+        # predict_batch_size > 1 asks server to send up to that many PREDICT_NOW before waiting for answers
+        # (see on_prediction_request and make_predictions), server may confirm smaller size or 0
+        options = []
+        if checksum_mode is not None:
+            options.append('%s=%s' % (LOGIN_OPTION_CHECKSUM, checksum_mode))
+        if orderbook_format is not None:
+            options.append('%s=%s' % (LOGIN_OPTION_ORDERBOOK, orderbook_format))
+        if predict_batch_size is not None:
+            options.append('%s=%d' % (LOGIN_OPTION_PREDICT_BATCH, predict_batch_size))
+        return self.send_message((LOGIN, username, pass_hash) + tuple(options))
 
     def send_volatility(self, volatility):
 
@@ -176,6 +486,13 @@ class Client(SessionImpl):
 
         return self.send_message((VOLATILITY, volatility))
 
+    def send_volatility_batch(self, prediction_ids, volatilities):
+        # answers for all ids passed to make_predictions(), in the same order
+        if len(prediction_ids) != len(volatilities):
+            raise ValueError("send_volatility_batch: {} volatilities for {} ids".format(len(volatilities), len(prediction_ids)))
+
+        return self.send_message((VOLATILITY_BATCH, prediction_ids[0]) + tuple(float(v) for v in volatilities))
+
     def on_header(self, csv_header):
         # should be overridden
         pass
@@ -184,14 +501,60 @@ class Client(SessionImpl):
         # should be overridden
         pass
 
+    def on_orderbook_row(self, row):
+        # may be overridden instead of on_orderbook: row is OrderbookRow, the same object for all orderbooks
+        pass
+
+    def on_orderbook_array(self, instrument, time_str, values):
+        # may be overridden to get orderbooks in binary format without any parsing:
+        # values are prices and volumes in header order (numpy float64 array if numpy is installed, tuple otherwise),
+        # numpy array is a view into receive buffer, copy it to keep after return
+        if self.use_orderbook_rows:
+            row = self.orderbook_row
+            row.instrument, row.time, row.values = instrument, time_str, values
+            self.on_orderbook_row(row)
+        else:
+            self.on_orderbook([instrument, time_str] + list(values))
+
     def on_score(self, items_processed, time_elapsed, score_value):
         # should be overridden
         pass
 
-    def make_prediction(self):
+    def on_interim_score(self, answers_processed, time_elapsed, score_value):
+        # may be overridden
+        pass
+
+    def on_latency_stats(self, p50, p90, p99, max_latency):
+        # response latency of the session in seconds, sent with SCORE (before on_score call)
+        pass
+
+    def make_prediction(self, instrument=None):
         # should be overridden
+        # instrument is set only if server evaluates several instruments (otherwise it's the only target one)
+        pass
+
+    def on_prediction_request(self, prediction_id, instrument):
+        # batch mode PREDICT_NOW: may be overridden to keep features of this moment for make_predictions()
+        # (next orderbooks are received before the batch is answered, prediction must not use them)
+        self.prediction_ids.append(prediction_id)
+
+    def make_predictions(self, prediction_ids):
+        # batch mode: should be overridden, answer with send_volatility_batch(prediction_ids, volatilities)
         pass
 
+    def call_prediction(self, callback, *args):
+        # calls make_prediction or make_predictions, with stage_timing sends STAGE_TIMES after the answer
+        if not self.stage_timing:
+            self.handle_callback_result(callback(*args))
+            return
+
+        enter_time = precise_time()
+        result = callback(*args)
+        exit_time = precise_time()
+        self.handle_callback_result(result)
+        if self.recv_time is not None and not hasattr(result, '__await__'):  # awaitable answers later
+            self.send_message((STAGE_TIMES, enter_time - self.recv_time, exit_time - enter_time))
+
     def on_message(self, message):
         tokens = message.split('\t')
         if tokens[0] == ORDERBOOK:
@@ -201,39 +564,210 @@ class Client(SessionImpl):
             # 3 = price0
             # 4 = vol0
             # ...
+            if self.use_orderbook_rows:
+                row = self.orderbook_row
+                if not isinstance(row.values, list):
+                    row.values = list(row.values)   # was a view of binary orderbook
+                row.instrument, row.time = tokens[1], tokens[2]
+                row.values[:] = map(float, islice(tokens, 3, None))
+                self.on_orderbook_row(row)
+                return
+
             instrument = tokens[1]
             time_str = tokens[2]
             cvs_line_items = [instrument, time_str] + [float(tokens[n]) for n in range(3, len(tokens))]
             self.on_orderbook(cvs_line_items)
 
         elif tokens[0] == PREDICT_NOW:
-            self.make_prediction()
+            if len(tokens) > 2:
+                # batch mode: instrument and prediction id
+                self.on_prediction_request(int(tokens[2]), tokens[1])
+            elif len(tokens) > 1:
+                # multi-instrument evaluation: instrument to predict volatility for
+                self.call_prediction(self.make_prediction, tokens[1])
+            else:
+                self.call_prediction(self.make_prediction)
 
         elif tokens[0] == HEADER:
+            self.orderbook_row = OrderbookRow(tokens[1:])
             self.on_header(tokens[1:])
 
         elif tokens[0] == SCORE:
+            if len(tokens) >= 8:
+                self.on_latency_stats(*map(float, tokens[4:8]))
             self.on_score(int(tokens[1]), float(tokens[2]), float(tokens[3]))
 
+        elif tokens[0] == PREDICT_BATCH:
+            prediction_ids, self.prediction_ids = self.prediction_ids, []
+            self.call_prediction(self.make_predictions, prediction_ids)
+
+        elif tokens[0] == INTERIM_SCORE:
+            self.on_interim_score(int(tokens[1]), float(tokens[2]), float(tokens[3]))
+
+        elif tokens[0] == CHECKSUM:
+            # server accepted checksum mode, all next messages in both directions use it
+            self.send_checksum_mode = self.recv_checksum_mode = tokens[1]
+
+        elif tokens[0] == ORDERBOOK_FORMAT:
+            self.orderbook_format = tokens[1]
+
+        elif tokens[0] == PREDICT_BATCH_SIZE:
+            self.predict_batch_size = int(tokens[1])
+
+    def on_binary_message(self, message_body):
+        if message_body[:len(BINARY_ORDERBOOK_PREFIX)] != BINARY_ORDERBOOK_PREFIX:
+            return
+
+        offset = len(BINARY_ORDERBOOK_PREFIX)
+        packed_instrument, packed_time = BINARY_ORDERBOOK_HEADER.unpack_from(message_body, offset)
+        offset += BINARY_ORDERBOOK_HEADER.size
+
+        instrument = self.binary_instruments.get(packed_instrument)
+        if instrument is None:
+            instrument = self.binary_instruments[packed_instrument] = bytes_to_string(packed_instrument.rstrip(b'\0'))
+        time_str = bytes_to_string(packed_time.rstrip(b'\0'))
+
+        if numpy is not None:
+            values = numpy.frombuffer(message_body, dtype='<f8', offset=offset)
+        else:
+            values = struct.unpack_from('<%dd' % ((len(message_body) - offset) // 8), message_body, offset)
+
+        self.on_orderbook_array(instrument, time_str, values)
+
+
+def prepare_header_raw_message(cvs_line_values, checksum_mode=CHECKSUM_MD5):
+    return make_raw_message((HEADER,) + tuple(cvs_line_values), checksum_mode)
 
-def prepare_header_raw_message(cvs_line_values):
-    return make_raw_message((HEADER,) + tuple(cvs_line_values))
 
+def prepare_orderbook_raw_message(cvs_line_values, checksum_mode=CHECKSUM_MD5):
+    return make_raw_message((ORDERBOOK,) + tuple(cvs_line_values), checksum_mode)
 
-def prepare_orderbook_raw_message(cvs_line_values):
-    return make_raw_message((ORDERBOOK,) + tuple(cvs_line_values))
 
+def fits_binary_orderbook_header(instrument, time_str):
+    # longer strings would be truncated by struct, such orderbooks must be sent as text
+    return len(string_to_bytes(str(instrument))) <= BINARY_ORDERBOOK_INSTRUMENT_LEN \
+        and len(string_to_bytes(str(time_str))) <= BINARY_ORDERBOOK_TIME_LEN
 
-def prepare_predict_now_raw_message():
-    return make_raw_message(PREDICT_NOW)
+
+def prepare_binary_orderbook_raw_message(cvs_line_values, checksum_mode=CHECKSUM_MD5):
+    instrument, time_str, values = cvs_line_values[0], cvs_line_values[1], cvs_line_values[2:]
+    if not fits_binary_orderbook_header(instrument, time_str):
+        raise ValueError("Instrument '{}' or time '{}' is too long for binary orderbook".format(instrument, time_str))
+    body = BINARY_ORDERBOOK_PREFIX \
+        + BINARY_ORDERBOOK_HEADER.pack(string_to_bytes(str(instrument)), string_to_bytes(str(time_str))) \
+        + struct.pack('<%dd' % len(values), *values)
+    return make_raw_binary_message(body, checksum_mode)
+
+
+def unpack_binary_orderbook(message_body):
+    # (instrument, time_str, values) of BINARY_ORDERBOOK message body, values are a tuple of floats
+    offset = len(BINARY_ORDERBOOK_PREFIX)
+    packed_instrument, packed_time = BINARY_ORDERBOOK_HEADER.unpack_from(message_body, offset)
+    offset += BINARY_ORDERBOOK_HEADER.size
+    values = struct.unpack_from('<%dd' % ((len(message_body) - offset) // 8), message_body, offset)
+    return bytes_to_string(packed_instrument.rstrip(b'\0')), bytes_to_string(packed_time.rstrip(b'\0')), values
+
+
+def raw_message_as_text(raw_message):
+    # frame for logs: binary orderbook values are shown as text (packed floats are not utf-8, may contain new lines)
+    body = raw_message[PREFIX_LEN:]
+    if body[:len(BINARY_ORDERBOOK_PREFIX)] == BINARY_ORDERBOOK_PREFIX:
+        instrument, time_str, values = unpack_binary_orderbook(body)
+        return bytes_to_string(raw_message[:PREFIX_LEN]) + '\t'.join((BINARY_ORDERBOOK, instrument, time_str) + tuple(str(x) for x in values))
+    if body[:len(BINARY_MESSAGE_PREFIX)] == BINARY_MESSAGE_PREFIX:
+        return repr(bytes(bytearray(raw_message)))
+    return bytes_to_string(raw_message)
+
+
+def binary_orderbook_frame_blocks(columns, checksum_mode=CHECKSUM_MD5):
+    """
+    BINARY_ORDERBOOK frames of many orderbooks (numpy is needed), frame n is the same as
+        prepare_binary_orderbook_raw_message((columns[0][n], columns[1][n], ...), checksum_mode)
+    yields (frames, lengths) by FRAME_BLOCK_ROWS rows as frame_blocks() does. Frames of a block
+    are packed into one numpy structured array, checksums are calculated body by body.
+    """
+    get_checksum = CHECKSUM_FUNCTIONS[checksum_mode]
+    columns = [column.to_numpy() if hasattr(column, 'to_numpy') else numpy.asarray(column) for column in columns]
+    values_count = len(columns) - 2
+    body_len = len(BINARY_ORDERBOOK_PREFIX) + BINARY_ORDERBOOK_HEADER.size + 8 * values_count
+    length_prefix = string_to_bytes('%0*d\t' % (MBODYLEN_LEN, body_len))
+    frame_type = numpy.dtype([('length', 'S%d' % len(length_prefix)), ('checksum', 'S%d' % CHECKSUM_LEN), ('tab', 'S1'),
+                              ('name', 'S%d' % len(BINARY_ORDERBOOK_PREFIX)),
+                              ('instrument', 'S%d' % BINARY_ORDERBOOK_INSTRUMENT_LEN),
+                              ('time', 'S%d' % BINARY_ORDERBOOK_TIME_LEN), ('values', '<f8', (values_count,))])
+    body_offset = frame_type.fields['name'][1]
+
+    for begin in range(0, len(columns[0]), FRAME_BLOCK_ROWS):
+        instruments, times = [format_column(column[begin : begin + FRAME_BLOCK_ROWS]) for column in columns[:2]]
+        if numpy.char.str_len(instruments).max() > BINARY_ORDERBOOK_INSTRUMENT_LEN \
+                or numpy.char.str_len(times).max() > BINARY_ORDERBOOK_TIME_LEN:
+            raise ValueError("Instrument or time is too long for binary orderbook")
+
+        frames = numpy.zeros(len(instruments), dtype=frame_type)
+        frames['length'] = length_prefix
+        frames['tab'] = b'\t'
+        frames['name'] = BINARY_ORDERBOOK_PREFIX
+        frames['instrument'] = instruments
+        frames['time'] = times
+        for n, column in enumerate(columns[2:]):
+            frames['values'][:, n] = column[begin : begin + FRAME_BLOCK_ROWS]
+
+        raw = frames.view(numpy.uint8).reshape(len(frames), frame_type.itemsize)
+        frames['checksum'] = [string_to_bytes(get_checksum(body)) for body in raw[:, body_offset:]]
+        yield frames.view('V%d' % frame_type.itemsize).tolist(), numpy.full(len(frames), frame_type.itemsize)
+
+
+def prepare_predict_now_raw_message(checksum_mode=CHECKSUM_MD5, instrument=None):
+    if instrument is not None:
+        return make_raw_message((PREDICT_NOW, instrument), checksum_mode)
+    return make_raw_message(PREDICT_NOW, checksum_mode)
 
 
 class Server(SessionImpl):
     def __init__(self, sock, run_result = None):
         super(Server, self).__init__(sock, run_result)
+        self.allowed_checksum_modes = (CHECKSUM_MD5, CHECKSUM_CRC32)
+        self.checksum_mode_negotiated = False
+        self.allowed_orderbook_formats = (ORDERBOOK_TEXT, ORDERBOOK_BINARY)
+        self.orderbook_format = ORDERBOOK_TEXT
+        self.max_predict_batch_size = 0     # batch mode is allowed if > 1
+        self.predict_batch_size = 0
+
+    def accept_checksum_mode(self, checksum_mode):
+        # answer CHECKSUM with requested mode if it's allowed (md5 otherwise) and switch to that mode
+        if self.checksum_mode_negotiated: return
+        self.checksum_mode_negotiated = True
+
+        if checksum_mode not in self.allowed_checksum_modes:
+            checksum_mode = CHECKSUM_MD5
+
+        self.send_message((CHECKSUM, checksum_mode))
+        self.send_checksum_mode = self.recv_checksum_mode = checksum_mode
+
+    def accept_orderbook_format(self, orderbook_format):
+        # answer ORDERBOOK_FORMAT with requested format if it's allowed (text otherwise)
+        if orderbook_format not in self.allowed_orderbook_formats:
+            orderbook_format = ORDERBOOK_TEXT
+
+        self.send_message((ORDERBOOK_FORMAT, orderbook_format))
+        self.orderbook_format = orderbook_format
 
-    def send_score(self, items_processed, time_elapsed, score_value):
-        return self.send_message((SCORE, items_processed, time_elapsed, score_value))
+    def accept_predict_batch_size(self, predict_batch_size):
+        # answer PREDICT_BATCH_SIZE with requested size limited by max_predict_batch_size (0 if batches are not allowed)
+        # and by PREDICT_BATCH_SIZE_LIMIT
+        predict_batch_size = min(predict_batch_size, self.max_predict_batch_size, PREDICT_BATCH_SIZE_LIMIT)
+        if predict_batch_size < 2:
+            predict_batch_size = 0
+
+        self.send_message((PREDICT_BATCH_SIZE, predict_batch_size))
+        self.predict_batch_size = predict_batch_size
+
+    def send_score(self, items_processed, time_elapsed, score_value, latency_percentiles=()):
+        # latency_percentiles: (p50, p90, p99, max) of response latency in seconds, optional
+        return self.send_message((SCORE, items_processed, time_elapsed, score_value) + tuple(latency_percentiles))
+
+    def send_interim_score(self, answers_processed, time_elapsed, score_value):
+        return self.send_message((INTERIM_SCORE, answers_processed, time_elapsed, score_value))
 
     def on_login(self, username, pass_hash):
         # should be overridden
@@ -243,32 +777,288 @@ class Server(SessionImpl):
         # should be overridden
         pass
 
+    def on_volatility_batch(self, first_prediction_id, volatilities):
+        # should be overridden if batch mode is allowed
+        pass
+
+    def on_stage_times(self, parse_time, predict_time):
+        # client's STAGE_TIMES of the last answer, may be overridden
+        pass
+
     def on_message(self, message):
         tokens = message.split('\t')
 
         if tokens[0] == VOLATILITY:
             self.on_volatility(float(tokens[1]))
 
+        if tokens[0] == VOLATILITY_BATCH:
+            self.on_volatility_batch(int(tokens[1]), [float(v) for v in tokens[2:]])
+
+        if tokens[0] == STAGE_TIMES:
+            self.on_stage_times(float(tokens[1]), float(tokens[2]))
+
         if tokens[0] == LOGIN:
+            options = dict(option.split('=', 1) for option in tokens[3:] if '=' in option)
+            if LOGIN_OPTION_CHECKSUM in options:
+                self.accept_checksum_mode(options[LOGIN_OPTION_CHECKSUM])
+            if LOGIN_OPTION_ORDERBOOK in options:
+                self.accept_orderbook_format(options[LOGIN_OPTION_ORDERBOOK])
+            if LOGIN_OPTION_PREDICT_BATCH in options:
+                self.accept_predict_batch_size(int(options[LOGIN_OPTION_PREDICT_BATCH]))
             self.on_login(tokens[1], tokens[2])
 
 
+class MemoryTransport(object):
+    """
+    Connection of two sessions in one process, without sockets: has socket methods used by SessionImpl.
+    Sent buffers are queued to the peer without copying (frames are not changed after sending),
+    recv_into() copies them to receive buffer. Sessions may run in two threads (SessionImpl.run()),
+    or in one thread by run_in_memory().
+    """
+    def __init__(self):
+        self.peer = None
+        self.incoming = collections.deque()   # buffers sent by peer
+        self.incoming_offset = 0    # bytes of incoming[0] already received
+        self.condition = threading.Condition()
+        self.closed = False         # by any side
+        self.timeout = None
+
+    def settimeout(self, timeout):
+        self.timeout = timeout
+
+    def sendmsg(self, buffers):
+        if self.closed:
+            raise DisconnectError("Connection is closed")
+        peer = self.peer
+        sent = 0
+        with peer.condition:
+            for buffer in buffers:
+                peer.incoming.append(buffer)
+                sent += len(buffer)
+            peer.condition.notify()
+        return sent
+
+    def send(self, data):
+        return self.sendmsg((data,))
+
+    def has_data(self):
+        # recv_into() would not wait
+        return bool(self.incoming) or self.closed
+
+    def recv_into(self, buffer):
+        # waits for data like blocking socket with timeout, returns 0 if connection is closed
+        with self.condition:
+            if not self.incoming and not self.closed:
+                self.condition.wait(self.timeout)
+            if not self.incoming:
+                if self.closed: return 0
+                raise socket.timeout("timed out")
+
+            received, size = 0, len(buffer)
+            while self.incoming and received < size:
+                data = memoryview(self.incoming[0])[self.incoming_offset:]
+                n = min(len(data), size - received)
+                buffer[received : received + n] = data[:n]
+                received += n
+                if n < len(data):
+                    self.incoming_offset += n
+                else:
+                    self.incoming.popleft()
+                    self.incoming_offset = 0
+            return received
+
+    def close(self):
+        for transport in (self, self.peer):
+            with transport.condition:
+                transport.closed = True
+                transport.condition.notify()
+
+
+def memory_transport_pair():
+    # two connected MemoryTransport, like socket.socketpair()
+    a, b = MemoryTransport(), MemoryTransport()
+    a.peer, b.peer = b, a
+    return a, b
+
+
+def run_in_memory(sessions):
+    # runs sessions connected by memory_transport_pair() in this thread, until all of them are stopped or wait
+    # for each other; every turn each session sends what it queued and processes everything it received.
+    # Returns run_result of every session
+    active = list(sessions)
+    while active:
+        for session in active:
+            session.flush_send_queue()
+            if session.stopped:
+                session.sock.close()
+        active = [session for session in active if not session.stopped]
+
+        received = False
+        for session in active:
+            if not session.sock.has_data():
+                continue
+            try:
+                if session.recv_and_process():
+                    received = True
+                    continue
+            except (DisconnectError, ValueError) as ex:
+                print("Disconnected, because", ex)
+            # connection is closed, nobody receives queued messages
+            session.stopped = True
+            session.sock.close()
+            del session.send_queue[:]
+
+        if not received:
+            break
+
+    for session in sessions:
+        session.sock.close()
+    return [session.run_result for session in sessions]
+
+
 # helper TCP functions
-def tcp_listen(host, port, accept_handler):
+def tcp_listen(host, port, accept_handler, max_sessions=1, fork=False):
+    # accept_handler returns True to stop listening
+    # max_sessions > 1: sessions are handled in parallel threads, or in forked processes if fork is True
+    # (new connections wait in backlog while max_sessions sessions are running)
     acceptor = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     acceptor.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
     acceptor.bind((host, port))
-    acceptor.listen(5)
-    while True:
-        connection, address = acceptor.accept()
-        print('Accepted from', address, '; TCP session started.')
-        res = accept_handler(connection, address)
-        if res: break
+    acceptor.listen(max(5, max_sessions))
+    serve(acceptor, accept_handler, max_sessions, fork)
+
+
+def unix_listen(path, accept_handler, max_sessions=1, fork=False):
+    # as tcp_listen() for Unix domain socket at path (Unix only), address passed to accept_handler
+    # is (socket file name, connection number)
+    if os.path.exists(path):
+        os.remove(path) # left by previous run
+    acceptor = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    acceptor.bind(path)
+    acceptor.listen(max(5, max_sessions))
+    try:
+        serve(acceptor, accept_handler, max_sessions, fork)
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def serve(acceptor, accept_handler, max_sessions=1, fork=False):
+    # accept connections of listening socket, see tcp_listen()
+    if fork:
+        tcp_serve_forked(acceptor, accept_handler, max_sessions)
+    elif max_sessions > 1:
+        tcp_serve_threads(acceptor, accept_handler, max_sessions)
+    else:
+        while True:
+            connection, address = tcp_accept(acceptor, lambda: False)
+            res = accept_handler(connection, address)
+            if res: break
+
     acceptor.close()
 
 
+def tcp_accept(acceptor, stop):
+    # wait for connection until stop() is True, returns (connection, address) or (None, None)
+    acceptor.settimeout(1.0)
+    while not stop():
+        try:
+            connection, address = acceptor.accept()
+        except socket.timeout:
+            continue
+        connection.settimeout(None)
+        if acceptor.family == getattr(socket, 'AF_UNIX', None):
+            # Unix socket peer has no address
+            address = (os.path.basename(acceptor.getsockname()), connection.fileno())
+        print('Accepted from', address, '; TCP session started.')
+        return connection, address
+    return None, None
+
+
+def tcp_serve_threads(acceptor, accept_handler, max_sessions):
+    slots = threading.BoundedSemaphore(max_sessions)
+    stop = threading.Event()
+
+    def handle(connection, address):
+        try:
+            if accept_handler(connection, address): stop.set()
+        finally:
+            slots.release()
+
+    while not stop.is_set():
+        slots.acquire()
+        connection, address = tcp_accept(acceptor, stop.is_set)
+        if connection is None:
+            slots.release()
+            break
+        thread = threading.Thread(target=handle, args=(connection, address))
+        thread.daemon = True
+        thread.start()
+
+    # wait for running sessions
+    for _ in range(max_sessions):
+        slots.acquire()
+
+
+TCP_STOP_EXIT_CODE = 3  # forked session process exit code when accept_handler asks to stop listening
+
+
+def tcp_serve_forked(acceptor, accept_handler, max_sessions):
+    # every session runs in its own process, data prepared before listening is shared copy-on-write
+    children = set()
+    stopped = [False]
+
+    def reap(block):
+        while children:
+            pid, status = os.waitpid(-1, 0 if block else os.WNOHANG)
+            if pid == 0: break
+            children.discard(pid)
+            if os.WIFEXITED(status) and os.WEXITSTATUS(status) == TCP_STOP_EXIT_CODE:
+                stopped[0] = True
+            block = False
+
+    def stop():
+        reap(block=False)
+        return stopped[0]
+
+    while not stopped[0]:
+        if len(children) >= max_sessions:
+            reap(block=True)
+            continue
+
+        connection, address = tcp_accept(acceptor, stop)
+        if connection is None:
+            break
+
+        pid = os.fork()
+        if pid == 0:
+            acceptor.close()
+            exit_code = 1
+            try:
+                exit_code = TCP_STOP_EXIT_CODE if accept_handler(connection, address) else 0
+            except Exception:
+                import traceback
+                traceback.print_exc()
+            finally:
+                sys.stdout.flush()
+                os._exit(exit_code)
+
+        connection.close()
+        children.add(pid)
+
+    while children:
+        reap(block=True)
+
+
 def tcp_connect(ip_address, port, connect_handler):
     sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     sock.connect((ip_address, port))
     print('Connected to', (ip_address, port), '; TCP session started.')
     connect_handler(sock)
+
+
+def unix_connect(path, connect_handler):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.connect(path)
+    print('Connected to', path, '; Unix socket session started.')
+    connect_handler(sock)
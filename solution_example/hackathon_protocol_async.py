@@ -0,0 +1,194 @@
+"""
+asyncio transport for hackathon_protocol sessions (python 3 only).
+
+AsyncClient and AsyncServer have the same callbacks as hackathon_protocol.Client and Server,
+framing, checksums and message dispatch are shared with them, only socket I/O is replaced by
+asyncio.Protocol. Many sessions are served by one event loop thread.
+
+make_prediction() of AsyncClient may be a coroutine ("async def"): incoming messages are not
+processed until it completes, so callbacks are called in the same order as in the blocking Client.
+
+    class MyClient(hackathon_protocol_async.AsyncClient):
+        def __init__(self):
+            super(MyClient, self).__init__()
+            self.send_login(USERNAME, PASSWORD)
+
+        async def make_prediction(self):
+            self.send_volatility(await self.model.predict())
+
+    asyncio.run(hackathon_protocol_async.tcp_connect(CONNECT_IP, CONNECT_PORT, MyClient))
+"""
+import asyncio, inspect, time
+import hackathon_protocol
+
+SOCKET_TIMEOUT = 1.0    # on_socket_timeout() is called after so many seconds without incoming data
+
+
+class AsyncSessionMixin(asyncio.Protocol):
+    # replaces socket I/O of hackathon_protocol.SessionImpl, must be first base class:
+    #     class AsyncSession(AsyncSessionMixin, hackathon_protocol.Server)
+    def __init__(self, *args, **kwargs):
+        super(AsyncSessionMixin, self).__init__(*args, **kwargs)
+        self.transport = None
+        self.finished = None    # future with run_result, done when connection is lost
+        self.timer = None
+        self.last_recv_time = time.time()
+
+    def get_finished(self):
+        if self.finished is None:
+            self.finished = asyncio.get_event_loop().create_future()
+        return self.finished
+
+    async def run(self):
+        # wait until session is finished, returns run_result like SessionImpl.run()
+        return await self.get_finished()
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.get_finished()
+        self.last_recv_time = time.time()
+        self.timer = asyncio.get_event_loop().call_later(SOCKET_TIMEOUT, self.check_timeout)
+        self.after_callbacks()  # messages queued before connection, e.g. LOGIN
+
+    def data_received(self, data):
+        self.last_recv_time = time.time()
+        self.recv_time = hackathon_protocol.precise_time()
+        self.bytes_recv += len(data)
+        self.append_received(data)
+        self.process_received()
+
+    def connection_lost(self, exc):
+        if exc is not None:
+            print("Disconnected, because", exc)
+        print("TCP Session finished")
+        if self.timer is not None:
+            self.timer.cancel()
+        finished = self.get_finished()
+        if not finished.done():
+            finished.set_result(self.run_result)
+
+    def append_received(self, data):
+        # copy data after already received bytes, compact or grow recv_buffer if there is no room
+        data_len = len(data)
+        begin, end = self.recv_begin, self.recv_end
+        if len(self.recv_buffer) - end < data_len:
+            unread = end - begin
+            if len(self.recv_buffer) < unread + data_len:
+                # only when reading is paused for a coroutine and transport delivers more data
+                buffer = bytearray(max(2 * len(self.recv_buffer), unread + data_len))
+                buffer[:unread] = self.recv_view[begin:end]
+                self.recv_buffer, self.recv_view = buffer, memoryview(buffer)
+            else:
+                self.recv_buffer[:unread] = self.recv_buffer[begin:end]
+            begin, end = 0, unread
+        self.recv_view[end : end + data_len] = data
+        self.recv_begin, self.recv_end = begin, end + data_len
+
+    def process_received(self):
+        try:
+            self.process_recv_buffer()
+        except (hackathon_protocol.DisconnectError, ValueError) as ex:
+            print("Disconnected, because", ex)
+            self.transport.close()
+            return
+        self.after_callbacks()
+
+    def after_callbacks(self):
+        # send what callbacks queued, close connection if they called stop()
+        if self.transport is None or self.transport.is_closing():
+            return
+        self.flush_send_queue()
+        if self.stopped:
+            self.transport.close()
+
+    def flush_send_queue(self):
+        # transport buffers the frames and writes them when socket is ready
+        queue = self.send_queue
+        if self.transport is None or not queue:
+            return
+        self.transport.writelines(queue)
+        self.send_syscalls += 1
+        self.messages_sent += len(queue)
+        del queue[:]
+
+    def handle_callback_result(self, result):
+        # awaitable result of callback: stop processing messages until it is done
+        if not inspect.isawaitable(result):
+            return
+        self.recv_paused = True
+        self.transport.pause_reading()
+        asyncio.ensure_future(result).add_done_callback(self.on_callback_done)
+
+    def on_callback_done(self, task):
+        self.recv_paused = False
+        if self.transport.is_closing():
+            return
+        if task.cancelled() or task.exception() is not None:
+            print("Disconnected, because", "callback cancelled" if task.cancelled() else repr(task.exception()))
+            self.transport.close()
+            return
+        self.transport.resume_reading()
+        self.process_received()
+
+    def check_timeout(self):
+        if self.transport.is_closing():
+            return
+        if not self.recv_paused and time.time() - self.last_recv_time >= SOCKET_TIMEOUT:
+            self.last_recv_time = time.time()
+            self.on_socket_timeout()
+            self.after_callbacks()
+        self.timer = asyncio.get_event_loop().call_later(SOCKET_TIMEOUT, self.check_timeout)
+
+
+class AsyncClient(AsyncSessionMixin, hackathon_protocol.Client):
+    def __init__(self):
+        super(AsyncClient, self).__init__(None)
+
+
+class AsyncServer(AsyncSessionMixin, hackathon_protocol.Server):
+    def __init__(self, run_result = None):
+        super(AsyncServer, self).__init__(None, run_result)
+
+
+async_session_classes = {}
+
+
+def get_async_session_class(session_class):
+    # asyncio version of existing hackathon_protocol.Server/Client subclass (constructor gets sock=None)
+    if session_class not in async_session_classes:
+        async_session_classes[session_class] = type('Async' + session_class.__name__, (AsyncSessionMixin, session_class), {})
+    return async_session_classes[session_class]
+
+
+# helper TCP functions
+async def tcp_listen(host, port, session_factory, session_finished=None):
+    # session_factory() returns new AsyncServer for every accepted connection,
+    # session_finished(session) is called when it is done and returns True to stop listening
+    loop = asyncio.get_event_loop()
+    stop = loop.create_future()
+
+    async def wait_session(session):
+        result = await session.run()
+        if session_finished is not None and session_finished(session) and not stop.done():
+            stop.set_result(result)
+
+    def protocol_factory():
+        session = session_factory()
+        loop.create_task(wait_session(session))
+        return session
+
+    server = await loop.create_server(protocol_factory, host, port, reuse_address=True)
+    print('Listening on', (host, port))
+    try:
+        await stop
+    finally:
+        server.close()
+        await server.wait_closed()
+
+
+async def tcp_connect(ip_address, port, client_factory):
+    # client_factory() returns new AsyncClient, returns its run_result when session is finished
+    loop = asyncio.get_event_loop()
+    transport, client = await loop.create_connection(client_factory, ip_address, port)
+    print('Connected to', (ip_address, port), '; TCP session started.')
+    return await client.run()
@@ -0,0 +1,92 @@
+"""
+hackathon_protocol tests:
+    python -m pytest -q test_hackathon_protocol.py  (or python -m unittest test_hackathon_protocol)
+"""
+import sys, unittest
+import hackathon_protocol
+
+HEADER = ['INSTRUMENT', 'TIME', 'ASK_P_1', 'ASK_V_1', 'BID_P_1', 'BID_V_1']
+ORDERBOOK = ['TEA', '2017-11-01 10:00:00.000001', 65001.0, 10.0, 64999.0, 1.5]
+
+
+class Output(object):
+    # stdout replacement, keeps printed text
+    def __init__(self):
+        self.text = ''
+
+    def write(self, text):
+        self.text += text
+
+    def flush(self):
+        pass
+
+
+class LoggingClient(hackathon_protocol.Client):
+    def __init__(self, sock):
+        super(LoggingClient, self).__init__(sock)
+        self.orderbooks = []
+        self.predictions = 0
+
+    def is_log_enabled(self):
+        return True
+
+    def on_orderbook(self, cvs_line_values):
+        self.orderbooks.append(cvs_line_values)
+
+    def make_prediction(self, instrument=None):
+        self.predictions += 1
+
+
+class LoggingServer(hackathon_protocol.Server):
+    def is_log_enabled(self):
+        return True
+
+
+def run_printing(func):
+    # calls func, returns printed text
+    stdout, sys.stdout = sys.stdout, Output()
+    try:
+        func()
+        return sys.stdout.text
+    finally:
+        sys.stdout = stdout
+
+
+class BinaryOrderbookLogTest(unittest.TestCase):
+
+    def test_client_receives_logged_binary_orderbook(self):
+        transport, peer = hackathon_protocol.memory_transport_pair()
+        client = LoggingClient(transport)
+        peer.sendmsg([hackathon_protocol.prepare_header_raw_message(HEADER),
+                      hackathon_protocol.prepare_binary_orderbook_raw_message(ORDERBOOK),
+                      hackathon_protocol.prepare_predict_now_raw_message()])
+        peer.close()
+
+        text = run_printing(client.run)
+
+        self.assertNotIn("Disconnected", text)
+        self.assertEqual(client.orderbooks, [ORDERBOOK])
+        self.assertEqual(client.predictions, 1)
+        self.assertIn("\tBINARY_ORDERBOOK\tTEA\t2017-11-01 10:00:00.000001\t65001.0\t10.0\t64999.0\t1.5\n", text)
+
+    def test_server_logs_sent_binary_orderbook(self):
+        transport, peer = hackathon_protocol.memory_transport_pair()
+        server = LoggingServer(transport)
+        frame = hackathon_protocol.prepare_binary_orderbook_raw_message(ORDERBOOK, hackathon_protocol.CHECKSUM_CRC32)
+
+        text = run_printing(lambda: server.send_raw_message(frame))
+
+        checksum = hackathon_protocol.crc32_hex_checksum(frame[hackathon_protocol.PREFIX_LEN:])
+        self.assertIn("[SEND] 0089\t%s\tBINARY_ORDERBOOK\tTEA\t" % checksum, text)
+
+    def test_raw_message_as_text(self):
+        text_frame = hackathon_protocol.prepare_orderbook_raw_message(ORDERBOOK)
+        self.assertEqual(hackathon_protocol.raw_message_as_text(text_frame), hackathon_protocol.bytes_to_string(text_frame))
+
+        frame = hackathon_protocol.prepare_binary_orderbook_raw_message(ORDERBOOK)
+        text = hackathon_protocol.raw_message_as_text(memoryview(frame))
+        self.assertEqual(text.split('\t')[2:], ['BINARY_ORDERBOOK', 'TEA', ORDERBOOK[1]] + [str(x) for x in ORDERBOOK[2:]])
+
+
+if __name__ == '__main__':
+    unittest.main()